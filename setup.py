@@ -0,0 +1,26 @@
+import os
+
+from setuptools import setup
+
+"""
+STIMPL needs no build step. Optionally, the interpreter loop
+(stimpl/runtime.py) can be compiled to a C extension with mypyc:
+
+  pip install mypy
+  STIMPL_MYPYC=1 python setup.py build_ext --inplace
+
+Python picks up the compiled module automatically; delete the generated
+stimpl/runtime.*.so to go back to the pure-Python interpreter.
+"""
+
+ext_modules = []
+if os.environ.get("STIMPL_MYPYC"):
+  from mypyc.build import mypycify
+  ext_modules = mypycify(["stimpl/runtime.py"])
+
+setup(
+  name="stimpl",
+  packages=["stimpl"],
+  python_requires=">=3.10",
+  ext_modules=ext_modules,
+)
@@ -1,5 +1,6 @@
 from stimpl.errors import *
 from stimpl.expression import *
+from stimpl.compiler import *
 from stimpl.runtime import *
 from stimpl.robustness import *
 from stimpl.test import *
@@ -0,0 +1,49 @@
+import ast
+import sys
+from typing import Any
+
+import stimpl.expression
+from stimpl.errors import InterpSyntaxError
+from stimpl.runtime import run_stimpl
+
+"""
+Run a STIMPL program stored in a file:
+
+  python -m stimpl [--debug] program.stimpl
+
+The file holds a single STIMPL expression written with the usual syntax,
+e.g. Program(Assign(Variable("four"), Add(IntLiteral(2), IntLiteral(2)))).
+The file is parsed, not run as Python: it may only call the expression
+classes, and their arguments must be expressions or literal values.
+"""
+
+EXPRESSION_CLASSES = {name: value for name, value in vars(stimpl.expression).items()
+                      if isinstance(value, type) and issubclass(value, stimpl.expression.Expr)}
+
+
+def build_expression(node: ast.expr) -> Any:
+    match node:
+        case ast.Call(func=ast.Name(id=name), args=args, keywords=[]) if name in EXPRESSION_CLASSES:
+            return EXPRESSION_CLASSES[name](*[build_expression(arg) for arg in args])
+        case ast.Constant(value=value) if type(value) in (int, float, str, bool):
+            return value
+        case ast.UnaryOp(op=ast.USub(), operand=ast.Constant(value=int() | float() as value)) if type(value) is not bool:
+            return -value
+        case _:
+            raise InterpSyntaxError(f"Unexpected {ast.unparse(node)} in program file: only expressions and literals are allowed")
+
+
+def parse_program(source: str) -> Any:
+    return build_expression(ast.parse(source, mode="eval").body)
+
+
+if __name__=='__main__':
+    debug = "--debug" in sys.argv[1:]
+    paths = [arg for arg in sys.argv[1:] if arg != "--debug"]
+    if len(paths) != 1:
+        print("usage: python -m stimpl [--debug] program.stimpl", file=sys.stderr)
+        sys.exit(2)
+
+    with open(paths[0]) as program_file:
+        program = parse_program(program_file.read())
+    run_stimpl(program, debug)
@@ -0,0 +1,355 @@
+import math
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.inference import children
+
+"""
+Blocks
+
+A run of consecutive assignments and While loops whose values only use
+literals, variables and operators on statically proven types (see
+stimpl/inference.py) is lowered to Python source and compiled with exec. Loop
+bodies may also contain Ifs and sequences. The resulting function takes the
+interpreter's variable slots and performs all of the statements on them, so
+the interpreter runs the whole run with a single instruction and CPython's
+own bytecode does the arithmetic and the looping. Like the interpreter, it
+appends the slot of every variable it assigns for the first time to
+`declared`. This is also how loops that numba could compile run, since their
+variables' types are known: kernels (see stimpl/jit.py) are for the loops
+left to the interpreter.
+
+Values are computed in the same order as the interpreter would compute them,
+and every check the interpreter would make at runtime (reads of unassigned
+variables, division by zero) is made at the same point, with the same error.
+Assignments need no type check: every value assigned in a block has its
+variable's inferred type, which is also the type of any earlier binding.
+
+Compiling the source costs far more than running a short block, so the
+functions of the last MAX_BLOCKS distinct sources are kept and reused (a
+program evaluated again produces the same source).
+"""
+
+MAX_BLOCKS = 256
+
+_OPERATORS = {
+    Add: "{} + {}",
+    Subtract: "{} - {}",
+    Multiply: "{} * {}",
+    And: "{} and {}",
+    Or: "{} or {}",
+    Lt: "{} < {}",
+    Lte: "{} <= {}",
+    Gt: "{} > {}",
+    Gte: "{} >= {}",
+    Eq: "{} == {}",
+    Ne: "not ({} == {})",
+}
+
+_OPERAND_TYPES: Dict[type, Tuple[Type, ...]] = {      # Operator -> the operand types it is defined on
+    Add: (INT_T, FLOAT_T, STR_T),
+    Subtract: (INT_T, FLOAT_T),
+    Multiply: (INT_T, FLOAT_T),
+    Divide: (INT_T, FLOAT_T),
+    And: (BOOL_T,),
+    Or: (BOOL_T,),
+}
+_OPERAND_TYPES.update({comparison: (INT_T, FLOAT_T, STR_T, BOOL_T) for comparison in (Lt, Lte, Gt, Gte, Eq, Ne)})
+
+_ARITHMETIC = (Add, Subtract, Multiply, Divide)
+
+_TYPE_NAMES = {Unit: "UNIT_T", Integer: "INT_T", FloatingPoint: "FLOAT_T", String: "STR_T", Boolean: "BOOL_T"}
+
+_MAX_NESTING = 16           # Python refuses to compile more than 20 statically nested blocks
+
+_UNBOUND = object()         # The value of a fetched variable that hasn't been assigned yet
+
+_BLOCKS: Dict[str, Callable[[list, list], None]] = {}      # Source -> its compiled function
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _read_before_assignment(variable_name: str) -> InterpSyntaxError:
+    return InterpSyntaxError(f"Cannot read from {variable_name} before assignment.")
+
+
+class _BlockWriter(object):
+    def __init__(self, variable_types: Dict[str, Optional[Type]], slots: Dict[str, int], assigned: Set[str]) -> None:
+        self.variable_types = variable_types    # Statically inferred variable types
+        self.slots = slots                      # Variable name -> its slot (new variables are given the next one)
+        self.bound = set(assigned)              # Variables certainly assigned at the point being written
+        self.unbound: Set[str] = set()          # Fetched variables whose local may still hold _UNBOUND
+        self.locals: Dict[str, str] = {}        # STIMPL name -> local holding its current value
+        self.fetched: Set[int] = set()          # Ids of the expressions whose variables have all been fetched
+        self.assigned: Dict[str, Type] = {}     # Assigned variables and their types
+        self.lines: List[str] = []
+        self.temporaries = 0
+        self.stores = 0                         # How many assignments have been written
+        self.nesting = 0                        # How many loops and branches enclose the code being written
+
+    def temporary(self) -> str:
+        self.temporaries += 1
+        return f"t{self.temporaries}"
+
+    def slot(self, variable_name: str) -> int:
+        return self.slots.setdefault(variable_name, len(self.slots))
+
+    def settle(self, variable_name: str) -> None:
+        """
+        Records that `variable_name` is known to be assigned from here on,
+        unless the code being written is conditional.
+        """
+        if self.nesting == 0:
+            self.unbound.discard(variable_name)
+            self.bound.add(variable_name)
+
+    def fetch(self, expression: Expr) -> None:
+        """
+        Fetches every variable `expression` uses into its local. Code that
+        may run any number of times can't fetch variables on first use.
+        """
+        work = [expression]
+        while work:
+            node = work.pop()
+            if id(node) in self.fetched:                        # Nested loops and branches were fetched with the outer one
+                continue
+            self.fetched.add(id(node))
+            work.extend(children(node))
+            if isinstance(node, Assign):
+                node = node.variable
+            if not isinstance(node, Variable) or node.variable_name in self.locals:
+                continue
+            variable_name = node.variable_name
+            local = self.locals[variable_name] = f"v{len(self.locals)}"
+            if variable_name in self.bound:
+                self.lines.append(f"{local} = slots[{self.slot(variable_name)}][0]")
+            else:
+                self.lines += [f"{local} = slots[{self.slot(variable_name)}]",
+                               f"{local} = _UNBOUND if {local} is None else {local}[0]"]
+                self.unbound.add(variable_name)
+
+    def operands(self, left: Expr, right: Expr) -> Tuple[Tuple[str, Optional[Type]], Tuple[str, Optional[Type]]]:
+        """
+        Writes the operands of a binary operator, left first. If the right
+        operand assigns variables, a left operand held in a variable's local
+        is copied before the right operand runs, so it keeps its value.
+        """
+        left_code, left_type = self.emit(left)
+        start, stores = len(self.lines), self.stores
+        right_value = self.emit(right)
+        if self.stores != stores and left_code in self.locals.values():
+            copy = self.temporary()
+            self.lines.insert(start, f"{copy} = {left_code}")
+            left_code = copy
+        return (left_code, left_type), right_value
+
+    def nested(self, expression: Expr) -> Tuple[Tuple[str, Optional[Type]], List[str]]:
+        """
+        Writes `expression` as the body of a compound statement, returning
+        its value and its (indented) lines.
+        """
+        if self.nesting == _MAX_NESTING:
+            raise _Unsupported()
+        lines = self.lines
+        self.lines = []
+        self.nesting += 1
+        value = self.emit(expression)
+        self.nesting -= 1
+        nested_lines = [f"    {line}" for line in self.lines]
+        self.lines = lines
+        return value, nested_lines
+
+    def emit(self, expression: Expr) -> Tuple[str, Optional[Type]]:
+        """
+        Appends the lines that compute `expression` and returns the Python
+        expression for its value along with its type (None for an If whose
+        branches disagree, whose value can't be used).
+        """
+        match expression:
+            case IntLiteral(literal=l):
+                return (repr(l), INT_T)
+
+            case StringLiteral(literal=l):
+                return (repr(l), STR_T)
+
+            case BooleanLiteral(literal=l):
+                return (repr(l), BOOL_T)
+
+            case FloatingPointLiteral(literal=l):
+                if not math.isfinite(l):                    # repr(inf) and repr(nan) aren't Python literals
+                    raise _Unsupported()
+                return (repr(l), FLOAT_T)
+
+            case Ren():
+                return ("None", UNIT_T)
+
+            case Variable(variable_name=variable_name):
+                variable_type = self.variable_types.get(variable_name)
+                if variable_type is None:
+                    raise _Unsupported()
+                if variable_name not in self.locals and variable_name not in self.bound:
+                    local = self.locals[variable_name] = f"v{len(self.locals)}"     # First read: fetch and check it here
+                    self.lines += [f"{local} = slots[{self.slot(variable_name)}]",
+                                   f"if {local} is None: raise _read_before_assignment({variable_name!r})",
+                                   f"{local} = {local}[0]"]
+                    self.bound.add(variable_name)
+                    return (local, variable_type)
+                self.fetch(expression)
+                local = self.locals[variable_name]
+                if variable_name in self.unbound:
+                    self.lines.append(f"if {local} is _UNBOUND: raise _read_before_assignment({variable_name!r})")
+                    self.settle(variable_name)
+                return (local, variable_type)
+
+            case Assign():
+                return self.emit_assign(expression)
+
+            case Sequence(exprs=exprs):
+                value: Tuple[str, Optional[Type]] = ("None", UNIT_T)   # An empty sequence evaluates to ren
+                for expr in exprs:
+                    value = self.emit(expr)
+                return value
+
+            case Not(expr=expr):
+                operand, operand_type = self.emit(expr)
+                if operand_type is not BOOL_T:
+                    raise _Unsupported()
+                result = self.temporary()
+                self.lines.append(f"{result} = not {operand}")
+                return (result, BOOL_T)
+
+            case BinaryOperator(left=left, right=right):
+                (left_code, left_type), (right_code, right_type) = self.operands(left, right)
+                if left_type is not right_type or left_type not in _OPERAND_TYPES[type(expression)]:
+                    raise _Unsupported()
+                result = self.temporary()
+
+                if type(expression) is Divide:
+                    self.lines.append(f"if {right_code} == 0: raise InterpMathError('Cannot Divide by Zero')")
+                    operator = "{} // {}" if left_type is INT_T else "{} / {}"
+                else:
+                    operator = _OPERATORS[type(expression)]
+                self.lines.append(f"{result} = {operator.format(left_code, right_code)}")
+                return (result, left_type if type(expression) in _ARITHMETIC else BOOL_T)
+
+            case If(condition=condition, true=true, false=false):
+                condition_code, condition_type = self.emit(condition)
+                if condition_type is not BOOL_T:
+                    raise _Unsupported()
+                self.fetch(true)
+                self.fetch(false)
+                (true_code, true_type), true_lines = self.nested(true)
+                (false_code, false_type), false_lines = self.nested(false)
+
+                result, result_type = "None", None
+                if true_type is false_type and true_type is not None:
+                    result, result_type = self.temporary(), true_type
+                    true_lines.append(f"    {result} = {true_code}")
+                    false_lines.append(f"    {result} = {false_code}")
+                self.lines += [f"if {condition_code}:", *(true_lines or ["    pass"]),
+                               "else:", *(false_lines or ["    pass"])]
+                return (result, result_type)
+
+            case While(condition=condition, body=body):
+                self.fetch(expression)
+                (condition_code, condition_type), condition_lines = self.nested(condition)
+                if condition_type is not BOOL_T:
+                    raise _Unsupported()
+                _, body_lines = self.nested(body)
+                self.lines += ["while True:", *condition_lines, f"    if not {condition_code}: break", *body_lines]
+                return ("False", BOOL_T)                    # A while loop evaluates to false
+
+            case _:
+                raise _Unsupported()
+
+    def emit_assign(self, expression: Assign) -> Tuple[str, Type]:
+        variable_name = expression.variable.variable_name
+        value, value_type = self.emit(expression.value)
+        variable_type = self.variable_types.get(variable_name)
+        if variable_type is None or value_type is not variable_type:
+            raise _Unsupported()
+
+        slot = self.slot(variable_name)
+        if variable_name in self.unbound:                   # First assignments are recorded as they happen
+            self.lines.append(f"if {self.locals[variable_name]} is _UNBOUND: declared.append({slot})")
+        elif variable_name not in self.bound:
+            self.lines.append(f"if slots[{slot}] is None: declared.append({slot})")
+        self.assigned.setdefault(variable_name, variable_type)
+        local = self.locals[variable_name] = self.locals.get(variable_name, f"v{len(self.locals)}")
+        self.lines.append(f"{local} = {value}")
+        self.stores += 1
+        self.settle(variable_name)
+        return (local, variable_type)
+
+
+def _too_deep(expression: Expr) -> bool:
+    """
+    Whether `expression` nests loops and branches deeper than a block can.
+    Only the levels a block could hold are walked.
+    """
+    work = [(expression, 0)]
+    while work:
+        node, nesting = work.pop()
+        if nesting > _MAX_NESTING:
+            return True
+        if isinstance(node, While):
+            work += [(child, nesting + 1) for child in children(node)]
+        elif isinstance(node, If):
+            work += [(node.condition, nesting), (node.true, nesting + 1), (node.false, nesting + 1)]
+        else:
+            work += [(child, nesting) for child in children(node)]
+    return False
+
+
+def is_block_statement(expression: Expr, variable_types: Dict[str, Optional[Type]]) -> bool:
+    """
+    Whether `expression` is an assignment or a loop that can be part of a
+    block.
+    """
+    if not isinstance(expression, (Assign, While)) or _too_deep(expression):
+        return False
+    try:
+        _BlockWriter(variable_types, {}, set()).emit(expression)
+    except (_Unsupported, RecursionError):
+        return False
+    return True
+
+
+def compile_block(statements: List[Expr], variable_types: Dict[str, Optional[Type]],
+                  slots: Dict[str, int], assigned: Set[str]) -> Callable[[list, list], None]:
+    """
+    Returns a function that runs `statements` (each of which must satisfy
+    is_block_statement), updating the slots and declared slots it's given.
+    Variables without a slot in `slots` are given one. `assigned` holds the
+    variables that are certainly assigned before the block runs.
+    """
+    writer = _BlockWriter(variable_types, slots, assigned)
+    for statement in statements:
+        writer.emit(statement)
+    for variable_name, variable_type in writer.assigned.items():
+        local = writer.locals[variable_name]
+        store = f"slots[{writer.slot(variable_name)}] = ({local}, {_TYPE_NAMES[type(variable_type)]})"
+        writer.lines.append(f"if {local} is not _UNBOUND: {store}" if variable_name in writer.unbound else store)
+
+    body = "\n".join(f"    {line}" for line in writer.lines)
+    source = (f"def _block(slots, declared):\n"
+              f"{body}\n")
+    block = _BLOCKS.get(source)
+    if block is not None:
+        return block
+
+    namespace: Dict[str, Any] = {
+        "InterpMathError": InterpMathError,
+        "_read_before_assignment": _read_before_assignment,
+        "_UNBOUND": _UNBOUND,
+    }
+    namespace.update({name: type_class() for type_class, name in _TYPE_NAMES.items()})
+    exec(source, namespace)
+    if len(_BLOCKS) == MAX_BLOCKS:
+        del _BLOCKS[next(iter(_BLOCKS))]                    # Forget the block that was compiled first
+    block = _BLOCKS[source] = namespace["_block"]
+    return block
@@ -0,0 +1,582 @@
+import operator
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+from stimpl.errors import *
+from stimpl.inference import arithmetic_type, infer_variable_types
+from stimpl.jit import try_jit_while
+from stimpl.codegen import compile_block, is_block_statement
+
+"""
+Opcodes
+
+Code is a flat list of ints. Opcodes that take an operand are immediately
+followed by it in the list (an index into the constant pool, a variable slot
+or a jump target).
+Binary operators come first so the interpreter can recognize them with a
+single comparison against BINARY_OP_COUNT.
+
+The *_TYPED opcodes (and OP_DIV_INT/OP_DIV_FLOAT) are only emitted when type
+inference has proven both operands have the same type and that the operator
+is defined on it, so they skip the runtime type checks.
+
+Variables are resolved to slots at compile time: every variable a program
+names gets an index into the interpreter's list of (value, type) pairs, so a
+read is a list index instead of a dict lookup by name. compile_stimpl returns
+the variable names in slot order.
+
+STIMPL has no short-circuit evaluation, but when the right operand of an And
+or Or can neither raise nor change the state, skipping it is unobservable. The
+compiler then emits OP_JMP_IF_FALSE_OR_POP/OP_JMP_IF_TRUE_OR_POP after the
+(Boolean) left operand instead of evaluating both sides.
+
+A typed operator whose operands are a variable and a constant (the `i < n` of
+a loop test, or the `i + 1` that steps it) is fused into one
+OP_APPLY_VAR_CONST instead of a load, a push and the operator.
+"""
+
+OP_ADD = 0
+OP_SUB = 1
+OP_MUL = 2
+OP_DIV = 3
+OP_AND = 4
+OP_OR = 5
+OP_LT = 6
+OP_LTE = 7
+OP_GT = 8
+OP_GTE = 9
+OP_EQ = 10
+OP_NE = 11
+OP_ADD_TYPED = 12
+OP_SUB_TYPED = 13
+OP_MUL_TYPED = 14
+OP_DIV_INT = 15
+OP_DIV_FLOAT = 16
+OP_AND_TYPED = 17
+OP_OR_TYPED = 18
+OP_LT_TYPED = 19
+OP_LTE_TYPED = 20
+OP_GT_TYPED = 21
+OP_GTE_TYPED = 22
+OP_EQ_TYPED = 23
+OP_NE_TYPED = 24
+BINARY_OP_COUNT = 25
+OP_PUSH_CONST = 25      # operand: const index of a (value, type) pair
+OP_LOAD = 26            # operand: variable slot
+OP_STORE = 27           # operand: variable slot
+OP_POP = 28
+OP_PRINT = 29
+OP_NOT = 30
+OP_JMP = 31             # operand: jump target
+OP_JMP_IF_FALSE = 32    # operands: jump target, const index of the error message
+OP_WHILE_KERNEL = 33    # operands: const index of a (WhileKernel, variable slots) pair, loop exit target (the push of its value)
+OP_JMP_IF_TRUE = 34     # operands: jump target, const index of the error message
+OP_STORE_POP = 35       # operand: variable slot
+OP_JMP_IF_FALSE_OR_POP = 36     # operand: jump target, taken (keeping the condition) if the condition is false
+OP_JMP_IF_TRUE_OR_POP = 37      # operand: jump target, taken (keeping the condition) if the condition is true
+OP_RUN_BLOCK = 38       # operand: const index of a compiled block of assignments (see stimpl/codegen.py)
+OP_APPLY_VAR_CONST = 39         # operands: variable slot, const index of an (operation, right operand, result type) triple
+
+__all__ = [
+    "OP_ADD", "OP_SUB", "OP_MUL", "OP_DIV", "OP_AND", "OP_OR", "OP_LT", "OP_LTE", "OP_GT", "OP_GTE", "OP_EQ", "OP_NE",
+    "OP_ADD_TYPED", "OP_SUB_TYPED", "OP_MUL_TYPED", "OP_DIV_INT", "OP_DIV_FLOAT", "OP_AND_TYPED", "OP_OR_TYPED",
+    "OP_LT_TYPED", "OP_LTE_TYPED", "OP_GT_TYPED", "OP_GTE_TYPED", "OP_EQ_TYPED", "OP_NE_TYPED", "BINARY_OP_COUNT",
+    "OP_PUSH_CONST", "OP_LOAD", "OP_STORE", "OP_POP", "OP_PRINT", "OP_NOT", "OP_JMP", "OP_JMP_IF_FALSE",
+    "OP_WHILE_KERNEL", "OP_JMP_IF_TRUE", "OP_STORE_POP", "OP_JMP_IF_FALSE_OR_POP", "OP_JMP_IF_TRUE_OR_POP",
+    "OP_RUN_BLOCK", "OP_APPLY_VAR_CONST",
+    "compile_stimpl",
+]
+
+"""
+Compiler
+"""
+
+BINARY_OPS = {
+    Add: OP_ADD,
+    Subtract: OP_SUB,
+    Multiply: OP_MUL,
+    Divide: OP_DIV,
+    And: OP_AND,
+    Or: OP_OR,
+    Lt: OP_LT,
+    Lte: OP_LTE,
+    Gt: OP_GT,
+    Gte: OP_GTE,
+    Eq: OP_EQ,
+    Ne: OP_NE,
+}
+
+TYPED_BINARY_OPS = {                # (operator, operand type class) -> unchecked opcode
+    (Add, Integer): OP_ADD_TYPED,
+    (Add, FloatingPoint): OP_ADD_TYPED,
+    (Add, String): OP_ADD_TYPED,
+    (Subtract, Integer): OP_SUB_TYPED,
+    (Subtract, FloatingPoint): OP_SUB_TYPED,
+    (Multiply, Integer): OP_MUL_TYPED,
+    (Multiply, FloatingPoint): OP_MUL_TYPED,
+    (Divide, Integer): OP_DIV_INT,
+    (Divide, FloatingPoint): OP_DIV_FLOAT,
+    (And, Boolean): OP_AND_TYPED,
+    (Or, Boolean): OP_OR_TYPED,
+}
+TYPED_BINARY_OPS.update({                                   # Every comparison is defined on every type but Unit
+    (comparison, operand_type): typed_op
+    for comparison, typed_op in ((Lt, OP_LT_TYPED), (Lte, OP_LTE_TYPED), (Gt, OP_GT_TYPED),
+                                 (Gte, OP_GTE_TYPED), (Eq, OP_EQ_TYPED), (Ne, OP_NE_TYPED))
+    for operand_type in (Integer, FloatingPoint, String, Boolean)
+})
+
+ARITHMETIC_OPS = (Add, Subtract, Multiply, Divide)
+
+FOLDABLE_OPS: Dict[int, Callable[[Any, Any], Any]] = {     # Typed opcode -> the operation its handler performs
+    OP_ADD_TYPED: operator.add,
+    OP_SUB_TYPED: operator.sub,
+    OP_MUL_TYPED: operator.mul,
+    OP_DIV_INT: operator.floordiv,
+    OP_DIV_FLOAT: operator.truediv,
+    OP_AND_TYPED: lambda left, right: left and right,
+    OP_OR_TYPED: lambda left, right: left or right,
+    OP_LT_TYPED: operator.lt,
+    OP_LTE_TYPED: operator.le,
+    OP_GT_TYPED: operator.gt,
+    OP_GTE_TYPED: operator.ge,
+    OP_EQ_TYPED: operator.eq,
+    OP_NE_TYPED: lambda left, right: not (left == right),
+}
+
+
+class Chunk(object):
+    def __init__(self, variable_types: Dict[str, Optional[Type]]) -> None:
+        self.code: List[int] = []
+        self.consts: List[Any] = []
+        self.variable_types = variable_types        # Statically inferred variable types (see stimpl/inference.py)
+        self.work: List[Tuple[Any, ...]] = []       # Pending compilation steps, run last-in first-out
+        self.types: List[Optional[Type]] = []       # Static types of the expressions compiled so far, innermost last
+        self.assigned: Set[str] = set()             # Variables assigned on every path to the code being compiled
+        self.slots: Dict[str, int] = {}             # Variable name -> its slot, in slot order
+        self.blocks: Dict[int, bool] = {}           # Id of an expression -> whether it can be part of a block
+        self.loops = 0                              # How many interpreted While loops enclose the code being compiled
+        self.unobservable: Dict[int, Optional[Type]] = {}   # Id of an expression -> its _unobservable_type, until assigned changes
+
+
+"""
+Compilation runs off the chunk's work stack instead of recursing, so deeply
+nested programs compile without hitting Python's recursion limit. A step is a
+tuple of a function and its arguments; the function is called with the chunk
+followed by those arguments. Compiling an expression for its value pushes its
+static type (None if unknown) onto chunk.types.
+"""
+
+
+def _schedule(chunk: Chunk, *steps: Tuple[Any, ...]) -> None:
+    chunk.work.extend(reversed(steps))                                      # So that steps run in the order they're given
+
+
+def _run(chunk: Chunk) -> None:
+    work = chunk.work
+    while work:
+        step, *arguments = work.pop()
+        step(chunk, *arguments)
+
+
+def _constants_since(chunk: Chunk, start: int, count: int) -> Optional[List[Tuple[Any, Type]]]:
+    """
+    Returns the constants pushed by the code emitted since `start` if that
+    code does nothing but push `count` constants, otherwise None.
+    """
+    code = chunk.code
+    if len(code) - start != 2 * count:
+        return None
+    if any(code[pc] != OP_PUSH_CONST for pc in range(start, len(code), 2)):
+        return None
+    return [chunk.consts[code[pc + 1]] for pc in range(start, len(code), 2)]
+
+
+def _discard_constants(chunk: Chunk, start: int) -> None:
+    """
+    Removes the constant pushes emitted since `start` (their pool entries are
+    the last ones, so they're dropped too).
+    """
+    del chunk.consts[chunk.code[start + 1]:]
+    del chunk.code[start:]
+
+
+def _replace_with_constant(chunk: Chunk, start: int, constant: Tuple[Any, Type]) -> None:
+    """
+    Replaces the constant pushes emitted since `start` with a single push of
+    `constant`.
+    """
+    _discard_constants(chunk, start)
+    chunk.code += [OP_PUSH_CONST, len(chunk.consts)]
+    chunk.consts.append(constant)
+
+
+def _compile_literal(chunk: Chunk, expression: Literal) -> None:
+    literal_type = LITERAL_TYPES[type(expression)]
+    chunk.code += [OP_PUSH_CONST, len(chunk.consts)]
+    chunk.consts.append((expression.literal, literal_type))
+    chunk.types.append(literal_type)
+
+
+def _compile_ren(chunk: Chunk, expression: Expr) -> None:
+    chunk.code += [OP_PUSH_CONST, len(chunk.consts)]
+    chunk.consts.append((None, UNIT_T))
+    chunk.types.append(UNIT_T)
+
+
+def _compile_print(chunk: Chunk, expression: Print) -> None:
+    _schedule(chunk, (_compile_value, expression.to_print), (_emit, OP_PRINT))    # Print evaluates to the printed value
+
+
+def _compile_sequence(chunk: Chunk, expression: Sequence) -> None:
+    if not expression.exprs:                                                # An empty sequence/program evaluates to ren
+        return _compile_ren(chunk, expression)
+    _schedule(chunk, *_effect_steps(chunk, expression.exprs[:-1]),         # Only the last expression's result is kept
+              (_compile_value, expression.exprs[-1]))
+
+
+def _slot(chunk: Chunk, variable_name: str) -> int:
+    return chunk.slots.setdefault(variable_name, len(chunk.slots))
+
+
+def _compile_variable(chunk: Chunk, expression: Variable) -> None:
+    chunk.code += [OP_LOAD, _slot(chunk, expression.variable_name)]
+    chunk.types.append(chunk.variable_types.get(expression.variable_name))
+
+
+def _compile_assign(chunk: Chunk, expression: Assign) -> None:
+    _schedule(chunk, (_compile_value, expression.value), (_emit_store, OP_STORE, expression))
+
+
+def _compile_not(chunk: Chunk, expression: Not) -> None:
+    _schedule(chunk, (_compile_value, expression.expr), (_finish_not, len(chunk.code)))
+
+
+def _finish_not(chunk: Chunk, start: int) -> None:
+    chunk.types.pop()
+    chunk.types.append(BOOL_T)
+    constants = _constants_since(chunk, start, 1)
+    if constants is not None and constants[0][1] is BOOL_T:                 # Fold negations of constants
+        _replace_with_constant(chunk, start, (not constants[0][0], BOOL_T))
+    else:
+        chunk.code.append(OP_NOT)
+
+
+def _compile_binary(chunk: Chunk, expression: BinaryOperator) -> None:
+    start = len(chunk.code)
+    if isinstance(expression, (And, Or)):
+        return _schedule(chunk, (_compile_value, expression.left), (_compile_logical_right, expression, start))
+    _schedule(chunk, (_compile_value, expression.left),                    # Operands are evaluated left-to-right
+              (_compile_value, expression.right),
+              (_finish_binary, expression, start))
+
+
+def _compile_logical_right(chunk: Chunk, expression: BinaryOperator, start: int) -> None:
+    code = chunk.code
+    if chunk.types[-1] is not BOOL_T or _constants_since(chunk, start, 1) is not None \
+            or _unobservable_type(chunk, expression.right) is not BOOL_T:
+        return _schedule(chunk, (_compile_value, expression.right), (_finish_binary, expression, start))
+
+    chunk.types.pop()                                                       # The right operand is only evaluated when the
+    code += [OP_JMP_IF_FALSE_OR_POP if isinstance(expression, And) else OP_JMP_IF_TRUE_OR_POP, 0]   # left doesn't decide
+    _schedule(chunk, (_compile_value, expression.right), (_finish_logical, len(code) - 1))
+
+
+def _finish_logical(chunk: Chunk, end_jump: int) -> None:
+    chunk.code[end_jump] = len(chunk.code)
+    chunk.types[-1] = BOOL_T
+
+
+def _unobservable_type(chunk: Chunk, expression: Expr) -> Optional[Type]:
+    """
+    Returns the type of `expression` if evaluating it at this point can't
+    raise or change the state (so skipping it is unobservable), otherwise None.
+    The results for compound expressions are remembered, so the operands of
+    nested Ands and Ors aren't walked again.
+    """
+    memo = chunk.unobservable
+    results: List[Optional[Type]] = []
+    work: List[Tuple[Expr, bool]] = [(expression, False)]
+    while work:
+        node, operands_done = work.pop()
+        if not operands_done and id(node) in memo:
+            results.append(memo[id(node)])
+        elif isinstance(node, BinaryOperator) and not operands_done:
+            work += [(node, True), (node.right, False), (node.left, False)]
+        elif isinstance(node, Not) and not operands_done:
+            work += [(node, True), (node.expr, False)]
+        elif isinstance(node, If) and not operands_done:
+            work += [(node, True), (node.false, False), (node.true, False), (node.condition, False)]
+        elif isinstance(node, Literal):
+            results.append(LITERAL_TYPES[type(node)])
+        elif isinstance(node, Ren):
+            results.append(UNIT_T)
+        elif isinstance(node, Variable) and node.variable_name in chunk.assigned:
+            results.append(chunk.variable_types.get(node.variable_name))
+        elif isinstance(node, Not):
+            results.append(BOOL_T if results.pop() is BOOL_T else None)
+            memo[id(node)] = results[-1]
+        elif isinstance(node, If):
+            false_type = results.pop()
+            true_type = results.pop()
+            condition_type = results.pop()
+            results.append(true_type if condition_type is BOOL_T and true_type is false_type else None)
+            memo[id(node)] = results[-1]
+        elif isinstance(node, BinaryOperator):
+            right_type = results.pop()
+            left_type = results.pop()
+            if left_type is None or left_type is not right_type or isinstance(node, Divide) \
+                    or (type(node), type(left_type)) not in TYPED_BINARY_OPS:     # Only typed operators are sure not to raise
+                results.append(None)
+            else:
+                results.append(left_type if type(node) in ARITHMETIC_OPS else BOOL_T)
+            memo[id(node)] = results[-1]
+        else:
+            results.append(None)
+    return results[0]
+
+
+def _finish_binary(chunk: Chunk, expression: BinaryOperator, start: int) -> None:
+    right_type = chunk.types.pop()
+    left_type = chunk.types.pop()
+    binary_operator = type(expression)
+
+    op = BINARY_OPS[binary_operator]
+    if left_type is not None and left_type is right_type:
+        op = TYPED_BINARY_OPS.get((binary_operator, type(left_type)), op)
+
+    result_type: Optional[Type] = BOOL_T
+    if binary_operator in ARITHMETIC_OPS:
+        inferred = arithmetic_type(left_type, right_type)
+        result_type = inferred if isinstance(inferred, Type) else None
+    chunk.types.append(result_type)
+
+    constants = _constants_since(chunk, start, 2) if op in FOLDABLE_OPS else None
+    if constants is not None:                                               # Fold operators whose operands are constants, unless
+        (left_value, operand_type), (right_value, _) = constants            # folding would hide an error the program must raise
+        if not ((op == OP_DIV_INT or op == OP_DIV_FLOAT) and right_value == 0):
+            folded_type = operand_type if binary_operator in ARITHMETIC_OPS else BOOL_T
+            return _replace_with_constant(chunk, start, (FOLDABLE_OPS[op](left_value, right_value), folded_type))
+
+    code = chunk.code
+    if op in FOLDABLE_OPS and len(code) - start == 4 and code[start] == OP_LOAD and code[start + 2] == OP_PUSH_CONST:
+        right_value, operand_type = chunk.consts[code[start + 3]]
+        if not ((op == OP_DIV_INT or op == OP_DIV_FLOAT) and right_value == 0):    # The fused operation can't raise
+            result_type = operand_type if binary_operator in ARITHMETIC_OPS else BOOL_T
+            chunk.consts[code[start + 3]] = (FOLDABLE_OPS[op], right_value, result_type)
+            code[start:] = [OP_APPLY_VAR_CONST, code[start + 1], code[start + 3]]
+            return
+    code.append(op)
+
+
+def _compile_if(chunk: Chunk, expression: If) -> None:
+    _schedule(chunk, (_compile_value, expression.condition), (_compile_if_branches, expression, len(chunk.code)))
+
+
+def _compile_if_branches(chunk: Chunk, expression: If, start: int) -> None:
+    code = chunk.code
+    chunk.types.pop()
+    constants = _constants_since(chunk, start, 1)
+    if constants is not None and constants[0][1] is BOOL_T:                 # Only the branch a constant condition picks can run
+        _discard_constants(chunk, start)
+        return _schedule(chunk, (_compile_value, expression.true if constants[0][0] else expression.false))
+    code += [OP_JMP_IF_FALSE, 0, len(chunk.consts)]
+    chunk.consts.append("Cannot perform If conditional on non-boolean condition")
+    else_jump = len(code) - 2                                               # Patched once we know where the else branch starts
+    _schedule(chunk, (_compile_value, expression.true), (_compile_if_else, expression, else_jump, set(chunk.assigned)))
+
+
+def _compile_if_else(chunk: Chunk, expression: If, else_jump: int, assigned_before: Set[str]) -> None:
+    code = chunk.code
+    code += [OP_JMP, 0]
+    code[else_jump] = len(code)
+    assigned_by_true = chunk.assigned
+    chunk.assigned = assigned_before
+    chunk.unobservable.clear()
+    _schedule(chunk, (_compile_value, expression.false), (_finish_if, len(code) - 1, assigned_by_true))
+
+
+def _finish_if(chunk: Chunk, end_jump: int, assigned_by_true: Set[str]) -> None:
+    chunk.code[end_jump] = len(chunk.code)
+    chunk.assigned &= assigned_by_true                                      # Only what both branches assign is certain
+    chunk.unobservable.clear()
+    false_type = chunk.types.pop()
+    true_type = chunk.types.pop()
+    chunk.types.append(true_type if true_type is false_type else None)
+
+
+def _compile_while(chunk: Chunk, expression: While) -> None:
+    code = chunk.code
+    if _is_block_statement(chunk, expression):                             # The loop runs as a block of its own
+        _emit_block(chunk, [expression])
+        code += [OP_PUSH_CONST, len(chunk.consts)]                          # A while loop evaluates to false
+        chunk.consts.append((False, BOOL_T))
+        chunk.types.append(BOOL_T)
+        return
+    code += [OP_JMP, 0]                                                     # The condition is tested at the bottom of the loop, so
+    entry_jump = len(code) - 1                                              # each iteration only dispatches one jump
+    chunk.loops += 1
+    _schedule(chunk, (_compile_effect, expression.body),
+              (_compile_while_condition, expression, entry_jump, set(chunk.assigned)))
+
+
+def _compile_while_condition(chunk: Chunk, expression: While, entry_jump: int, assigned_before: Set[str]) -> None:
+    code = chunk.code
+    body_start = entry_jump + 1
+    code[entry_jump] = len(code)
+    chunk.assigned = assigned_before                                        # The body may never run (but the condition always does)
+    chunk.unobservable.clear()
+    kernel_exit = None
+    kernel = try_jit_while(expression.condition, expression.body)
+    if kernel is not None:                                                  # Numeric loops can be handed off to a compiled kernel
+        code += [OP_WHILE_KERNEL, len(chunk.consts), 0]
+        chunk.consts.append((kernel, tuple(_slot(chunk, variable_name) for variable_name in kernel.names)))
+        kernel_exit = len(code) - 1
+    _schedule(chunk, (_compile_value, expression.condition), (_finish_while, body_start, kernel_exit))
+
+
+def _finish_while(chunk: Chunk, body_start: int, kernel_exit: Optional[int]) -> None:
+    code = chunk.code
+    chunk.types.pop()
+    chunk.loops -= 1
+    code += [OP_JMP_IF_TRUE, body_start, len(chunk.consts)]
+    chunk.consts.append("Cannot evaluate while loops for {}s")
+
+    if kernel_exit is not None:
+        code[kernel_exit] = len(code)
+    code += [OP_PUSH_CONST, len(chunk.consts)]                              # A while loop evaluates to false
+    chunk.consts.append((False, BOOL_T))
+    chunk.types.append(BOOL_T)
+
+
+def _emit(chunk: Chunk, op: int) -> None:
+    chunk.code.append(op)
+
+
+def _emit_pop(chunk: Chunk) -> None:
+    chunk.code.append(OP_POP)
+    chunk.types.pop()
+
+
+def _is_block_statement(chunk: Chunk, expression: Expr) -> bool:
+    is_block = chunk.blocks.get(id(expression))             # Deciding walks the whole expression, so it's only done once
+    if is_block is None:
+        is_block = chunk.blocks[id(expression)] = is_block_statement(expression, chunk.variable_types)
+    return is_block
+
+
+def _emit_block(chunk: Chunk, statements: List[Expr]) -> None:
+    chunk.code += [OP_RUN_BLOCK, len(chunk.consts)]
+    chunk.consts.append(compile_block(statements, chunk.variable_types, chunk.slots, chunk.assigned))
+    chunk.assigned.update(statement.variable.variable_name for statement in statements     # Loops may not run at all
+                          if isinstance(statement, Assign))
+    chunk.unobservable.clear()
+
+
+def _emit_store(chunk: Chunk, op: int, expression: Assign) -> None:
+    chunk.code += [op, _slot(chunk, expression.variable.variable_name)]
+    chunk.assigned.add(expression.variable.variable_name)
+    chunk.unobservable.clear()
+    if op == OP_STORE_POP:
+        chunk.types.pop()
+
+
+LITERAL_TYPES = {
+    IntLiteral: INT_T,
+    FloatingPointLiteral: FLOAT_T,
+    StringLiteral: STR_T,
+    BooleanLiteral: BOOL_T,
+}
+
+COMPILERS: Dict[type, Callable[[Chunk, Any], None]] = {
+    Ren: _compile_ren,
+    IntLiteral: _compile_literal,
+    FloatingPointLiteral: _compile_literal,
+    StringLiteral: _compile_literal,
+    BooleanLiteral: _compile_literal,
+    Print: _compile_print,
+    Sequence: _compile_sequence,
+    Program: _compile_sequence,
+    Variable: _compile_variable,
+    Assign: _compile_assign,
+    Not: _compile_not,
+    If: _compile_if,
+    While: _compile_while,
+}
+COMPILERS.update({binary_operator: _compile_binary for binary_operator in BINARY_OPS})
+
+
+def _compile_value(chunk: Chunk, expression: Expr) -> None:
+    compiler = COMPILERS.get(type(expression))
+    if compiler is None:
+        raise InterpSyntaxError("Unhandled!")
+    compiler(chunk, expression)
+
+
+def _block_steps(chunk: Chunk, block: List[Expr]) -> List[Tuple[Any, ...]]:
+    """
+    Compiling a block costs far more than interpreting straight-line code
+    once, so only runs that loop, or that run inside a loop, become blocks.
+    """
+    if chunk.loops or any(isinstance(statement, While) for statement in block):
+        return [(_emit_block, block)]
+    return [(_compile_effect, statement) for statement in block]
+
+
+def _effect_steps(chunk: Chunk, statements: Tuple[Expr, ...]) -> List[Tuple[Any, ...]]:
+    steps: List[Tuple[Any, ...]] = []
+    block: List[Expr] = []
+    may_loop = chunk.loops or any(isinstance(statement, While) for statement in statements)
+    for statement in statements:                                            # Runs of simple assignments and loops become a single block
+        if may_loop and _is_block_statement(chunk, statement):
+            block.append(statement)
+            continue
+        if block:
+            steps += _block_steps(chunk, block)
+            block = []
+        steps.append((_compile_effect, statement))
+    if block:
+        steps += _block_steps(chunk, block)
+    return steps
+
+
+def _compile_effect(chunk: Chunk, expression: Expr) -> None:
+    if isinstance(expression, (Sequence, Program)):
+        _schedule(chunk, *_effect_steps(chunk, expression.exprs))
+    elif (chunk.loops or isinstance(expression, While)) and _is_block_statement(chunk, expression):
+        _emit_block(chunk, [expression])
+    elif isinstance(expression, Assign):
+        _schedule(chunk, (_compile_value, expression.value), (_emit_store, OP_STORE_POP, expression))
+    elif _unobservable_type(chunk, expression) is None:                     # Pure expressions that can't raise have no effects to keep
+        _schedule(chunk, (_compile_value, expression), (_emit_pop,))
+
+
+def compile_expr(expression: Expr, chunk: Chunk) -> Optional[Type]:
+    """
+    Appends the code for `expression` to `chunk` and returns the expression's
+    statically inferred type (None if unknown).
+    """
+    _schedule(chunk, (_compile_value, expression))
+    _run(chunk)
+    return chunk.types.pop()
+
+
+def compile_for_effect(expression: Expr, chunk: Chunk) -> None:
+    """
+    Appends code that evaluates `expression` and discards its value.
+    """
+    _schedule(chunk, (_compile_effect, expression))
+    _run(chunk)
+
+
+def compile_stimpl(program: Expr, bound_types: Optional[Dict[str, Type]] = None) -> Tuple[List[int], List[Any], List[str]]:
+    """
+    Compiles `program` to run against a state whose variables have the types
+    in `bound_types`. Returns the code, the constant pool and the names of
+    the variables in slot order.
+    """
+    chunk = Chunk(infer_variable_types(program, bound_types))
+    chunk.assigned.update(bound_types or ())                                # Variables bound before the program are always assigned
+    compile_expr(program, chunk)
+    return chunk.code, chunk.consts, list(chunk.slots)
@@ -0,0 +1,157 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+
+"""
+Static type inference
+
+A variable's type is fixed by its first assignment and every later assignment
+of a different type raises. So if every assignment to a variable in a program
+produces the same type, that variable has that type whenever it is bound. The
+inference below computes those types once, before a program runs, and lets the
+compiler emit operators that skip the runtime type checks.
+
+Inferred types are only a claim about evaluations that complete normally; the
+compiler still emits checked code whenever a type is not known, so programs
+raise exactly the same errors at exactly the same time.
+
+The analysis works on a three-level lattice per variable: not yet seen
+(absent from the environment), a single Type, or None for "could be anything".
+"""
+
+_NEVER = object()       # An expression that can never complete normally, e.g. a read of a never-assigned variable
+
+_ARITHMETIC = (Add, Subtract, Multiply, Divide)
+_BOOLEAN = (And, Or, Not, Lt, Lte, Gt, Gte, Eq, Ne, While)
+
+
+def _join(a: Any, b: Any) -> Any:
+    if a is _NEVER:
+        return b
+    if b is _NEVER or a is b:
+        return a
+    return None
+
+
+def arithmetic_type(left_type: Any, right_type: Any) -> Any:
+    """
+    Arithmetic only completes when both operands have the same type, so
+    knowing either operand's type is enough to know the result's.
+    """
+    if left_type is _NEVER or right_type is _NEVER:
+        return _NEVER
+    if left_type is None or left_type is right_type:
+        return right_type
+    if right_type is None:
+        return left_type
+    return _NEVER                                               # Mismatched operands always raise
+
+
+_CONSTANT_TYPES: Dict[type, Type] = {         # Expressions whose type doesn't depend on their operands
+    Ren: UNIT_T,
+    IntLiteral: INT_T,
+    FloatingPointLiteral: FLOAT_T,
+    StringLiteral: STR_T,
+    BooleanLiteral: BOOL_T,
+}
+_CONSTANT_TYPES.update({boolean: BOOL_T for boolean in _BOOLEAN})
+
+_OPERANDS: Dict[type, Callable[[Any], Tuple[Expr, ...]]] = {   # Expression -> the subexpressions whose types decide its type
+    Assign: lambda expression: (expression.value,),
+    Print: lambda expression: (expression.to_print,),
+    Sequence: lambda expression: expression.exprs[-1:],
+    Program: lambda expression: expression.exprs[-1:],
+    If: lambda expression: (expression.true, expression.false),
+}
+_OPERANDS.update({arithmetic: lambda expression: (expression.left, expression.right) for arithmetic in _ARITHMETIC})
+
+_COMBINERS: Dict[type, Callable[[List[Any]], Any]] = {         # Expression -> its type, given its operands' types
+    Assign: lambda operand_types: operand_types[0],
+    Print: lambda operand_types: operand_types[0],
+    Sequence: lambda operand_types: operand_types[0] if operand_types else UNIT_T,
+    Program: lambda operand_types: operand_types[0] if operand_types else UNIT_T,
+    If: lambda operand_types: _join(*operand_types),
+}
+_COMBINERS.update({arithmetic: lambda operand_types: arithmetic_type(*operand_types) for arithmetic in _ARITHMETIC})
+
+
+def _infer(expression: Expr, variable_types: Dict[str, Optional[Type]]) -> Any:
+    results: List[Any] = []
+    work: List[Tuple[Expr, int]] = [(expression, -1)]          # Walked with an explicit stack so deep programs don't recurse
+    while work:
+        node, operand_count = work.pop()                        # A count of -1 means the operands haven't been visited yet
+        node_type = type(node)
+        if operand_count < 0 and node_type in _OPERANDS:
+            operands = _OPERANDS[node_type](node)
+            work.append((node, len(operands)))
+            work.extend((operand, -1) for operand in reversed(operands))
+        elif node_type in _COMBINERS:
+            operand_types = results[len(results) - operand_count:]
+            del results[len(results) - operand_count:]
+            results.append(_COMBINERS[node_type](operand_types))
+        elif isinstance(node, Variable):
+            results.append(variable_types.get(node.variable_name, _NEVER))
+        else:
+            results.append(_CONSTANT_TYPES.get(node_type))
+    return results[0]
+
+
+def children(expression: Expr) -> Tuple[Expr, ...]:
+    match expression:
+        case BinaryOperator(left=left, right=right):
+            return (left, right)
+        case Not(expr=expr):
+            return (expr,)
+        case Print(to_print=to_print):
+            return (to_print,)
+        case Assign(value=value):
+            return (value,)
+        case Sequence(exprs=exprs) | Program(exprs=exprs):
+            return exprs
+        case If(condition=condition, true=true, false=false):
+            return (condition, true, false)
+        case While(condition=condition, body=body):
+            return (condition, body)
+        case _:
+            return ()
+
+
+def _collect_assignments(expression: Expr, assignments: List[Tuple[str, Expr]]) -> None:
+    work = [expression]
+    while work:
+        node = work.pop()
+        if isinstance(node, Assign):
+            assignments.append((node.variable.variable_name, node.value))
+        work.extend(reversed(children(node)))
+
+
+def infer_variable_types(program: Expr, bound_types: Optional[Dict[str, Type]] = None) -> Dict[str, Optional[Type]]:
+    """
+    Returns the type of every variable assigned in `program` or bound (with
+    the type in `bound_types`) before it runs, or None for a variable whose
+    types disagree or cannot be inferred.
+    """
+    assignments: List[Tuple[str, Expr]] = []
+    _collect_assignments(program, assignments)
+
+    variable_types: Dict[str, Optional[Type]] = dict(bound_types) if bound_types else {}
+    changed = True
+    while changed:                                              # Each variable can only move up the lattice twice
+        changed = False
+        for variable_name, value in assignments:
+            old_type = variable_types.get(variable_name, _NEVER)
+            new_type = _join(old_type, _infer(value, variable_types))
+            if new_type is not old_type:
+                variable_types[variable_name] = new_type
+                changed = True
+    return variable_types
+
+
+def infer_type(expression: Expr, variable_types: Dict[str, Optional[Type]]) -> Optional[Type]:
+    """
+    Returns the type `expression` has whenever it evaluates without raising,
+    or None if that isn't known statically.
+    """
+    inferred = _infer(expression, variable_types)
+    return None if inferred is _NEVER else inferred
@@ -0,0 +1,367 @@
+import importlib.util
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from stimpl.expression import *
+from stimpl.types import *
+
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None          # numba is optional; without it loops are always interpreted
+
+"""
+Numeric While-loop kernels
+
+A While loop whose condition and body only use numeric and Boolean literals,
+variables, arithmetic, comparisons, logical operators, Ifs and assignments is
+lowered to Python source and compiled with numba. Kernels are specialized on
+the types of the loop's variables at the time the loop is entered.
+
+numba works on 64-bit machine integers, while STIMPL integers are unbounded.
+The kernel therefore guards every integer operation and, when an operand gets
+too large (or a divisor is zero), bails out with the variable values from the
+start of the iteration. The interpreter then picks the loop up from there, so
+the observable behavior is the same as if the loop had never been compiled.
+
+Literals are passed to kernels as arguments, so loops that only differ in
+their constants share one kernel. Compiling a kernel costs about as much as
+running a hundred thousand interpreted iterations, so a loop is only handed
+to numba once it has run HOT_LOOP_THRESHOLD iterations in the interpreter
+(or WARM_LOOP_THRESHOLD, if a kernel it can use has already been compiled).
+At most MAX_KERNELS loop shapes keep their compiled kernels. Importing numba
+takes longer than most programs run, so it is only imported when the first
+kernel is compiled.
+"""
+
+HOT_LOOP_THRESHOLD = 100000
+WARM_LOOP_THRESHOLD = 100
+MAX_KERNELS = 64
+
+_INT_BOUND = 2 ** 62 - 1    # Sums and differences of values within this bound fit in an int64 (2 ** 62 + 2 ** 62 does not)
+_MUL_BOUND = 2 ** 31        # Products of values within this bound fit in an int64
+_MAX_KERNEL_LINES = 500     # numba's compile time and memory grow quickly with the size of a kernel
+
+_UNBOX = {INT_T: int, FLOAT_T: float, BOOL_T: bool}     # Kernel results -> the interpreter's Python values
+
+_NUMERIC_OPS = {Add: "+", Subtract: "-", Multiply: "*"}
+_COMPARISON_OPS = {Lt: "<", Lte: "<=", Gt: ">", Gte: ">=", Eq: "==", Ne: "!="}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _collect_variables(expression: Expr, names: List[str], literals: List[Any]) -> None:
+    """
+    Appends the variables `expression` uses to `names` (once each) and the
+    values of its literals to `literals`, in the order the kernel uses them.
+    """
+    match expression:
+        case IntLiteral(literal=l):
+            if abs(l) > _INT_BOUND:
+                raise _Unsupported()
+            literals.append(int(l))
+        case FloatingPointLiteral(literal=l):
+            if not math.isfinite(l):
+                raise _Unsupported()
+            literals.append(float(l))
+        case BooleanLiteral(literal=l):
+            literals.append(bool(l))
+        case Ren():
+            pass
+        case Variable(variable_name=variable_name):
+            if variable_name not in names:
+                names.append(variable_name)
+        case Assign(variable=variable, value=value):
+            _collect_variables(value, names, literals)
+            _collect_variables(variable, names, literals)
+        case Sequence(exprs=exprs) | Program(exprs=exprs):
+            if not exprs:
+                raise _Unsupported()
+            for expr in exprs:
+                _collect_variables(expr, names, literals)
+        case Add(left=left, right=right) | Subtract(left=left, right=right) | \
+                Multiply(left=left, right=right) | Divide(left=left, right=right) | \
+                Lt(left=left, right=right) | Lte(left=left, right=right) | \
+                Gt(left=left, right=right) | Gte(left=left, right=right) | \
+                Eq(left=left, right=right) | Ne(left=left, right=right) | \
+                And(left=left, right=right) | Or(left=left, right=right):
+            _collect_variables(left, names, literals)
+            _collect_variables(right, names, literals)
+        case Not(expr=expr):
+            _collect_variables(expr, names, literals)
+        case If(condition=condition, true=true, false=false):
+            _collect_variables(condition, names, literals)
+            _collect_variables(true, names, literals)
+            _collect_variables(false, names, literals)
+        case _:
+            raise _Unsupported()
+
+
+def _structural_key(expression: Expr) -> Any:
+    match expression:
+        case Literal():
+            return (type(expression),)                                  # Literal values are kernel arguments
+        case Variable(variable_name=variable_name):
+            return (Variable, variable_name)
+        case Assign(variable=variable, value=value):
+            return (Assign, variable.variable_name, _structural_key(value))
+        case Sequence(exprs=exprs) | Program(exprs=exprs):
+            return (type(expression),) + tuple(_structural_key(expr) for expr in exprs)
+        case BinaryOperator(left=left, right=right):
+            return (type(expression), _structural_key(left), _structural_key(right))
+        case Not(expr=expr):
+            return (Not, _structural_key(expr))
+        case If(condition=condition, true=true, false=false):
+            return (If, _structural_key(condition), _structural_key(true), _structural_key(false))
+        case Ren():
+            return (Ren,)
+        case While(condition=condition, body=body):
+            return (While, _structural_key(condition), _structural_key(body))
+
+
+class _KernelWriter(object):
+    def __init__(self, variables: Dict[str, str], types: Dict[str, Type]) -> None:
+        self.variables = variables          # STIMPL name -> kernel local
+        self.types = types                  # STIMPL name -> STIMPL type
+        self.lines: List[str] = []
+        self.temporaries = 0
+        self.literals = 0
+        self.stores = 0                     # How many assignments have been written
+
+    def temporary(self) -> str:
+        self.temporaries += 1
+        return f"t{self.temporaries}"
+
+    def literal(self) -> str:
+        self.literals += 1                  # Literals are visited in the order _collect_variables lists them
+        return f"c{self.literals - 1}"
+
+    def operands(self, left: Expr, right: Expr) -> Tuple[Tuple[str, Optional[Type]], Tuple[str, Optional[Type]]]:
+        """
+        Writes the operands of a binary operator, left first, copying a left
+        operand held in a variable's local if the right operand assigns
+        variables.
+        """
+        left_code, left_type = self.emit(left)
+        start, stores = len(self.lines), self.stores
+        right_value = self.emit(right)
+        if self.stores != stores and left_code in self.variables.values():
+            copy = self.temporary()
+            self.lines.insert(start, f"{copy} = {left_code}")
+            left_code = copy
+        return (left_code, left_type), right_value
+
+    def guard(self, condition: str) -> None:
+        self.lines.append(f"if not ({condition}): return _bail")
+
+    def emit(self, expression: Expr) -> Tuple[str, Optional[Type]]:
+        match expression:
+            case IntLiteral():
+                return (self.literal(), INT_T)
+
+            case FloatingPointLiteral():
+                return (self.literal(), FLOAT_T)
+
+            case BooleanLiteral():
+                return (self.literal(), BOOL_T)
+
+            case Ren():
+                return ("None", UNIT_T)
+
+            case Variable(variable_name=variable_name):
+                return (self.variables[variable_name], self.types[variable_name])
+
+            case Assign(variable=variable, value=value):
+                value_code, value_type = self.emit(value)
+                if value_type is not self.types[variable.variable_name]:
+                    raise _Unsupported()
+                local = self.variables[variable.variable_name]
+                self.lines.append(f"{local} = {value_code}")
+                self.stores += 1
+                return (local, value_type)
+
+            case Sequence(exprs=exprs) | Program(exprs=exprs):
+                for expr in exprs:
+                    last = self.emit(expr)
+                return last
+
+            case Not(expr=expr):
+                operand, operand_type = self.emit(expr)
+                if operand_type is not BOOL_T:
+                    raise _Unsupported()
+                result = self.temporary()
+                self.lines.append(f"{result} = not {operand}")
+                return (result, BOOL_T)
+
+            case And(left=left, right=right) | Or(left=left, right=right):
+                (left_code, left_type), (right_code, right_type) = self.operands(left, right)    # Both are evaluated, as in the interpreter
+                if left_type is not BOOL_T or right_type is not BOOL_T:
+                    raise _Unsupported()
+                result = self.temporary()
+                self.lines.append(f"{result} = {left_code} {'and' if type(expression) is And else 'or'} {right_code}")
+                return (result, BOOL_T)
+
+            case If(condition=condition, true=true, false=false):
+                condition_code, condition_type = self.emit(condition)
+                if condition_type is not BOOL_T:
+                    raise _Unsupported()
+                lines = self.lines
+                branches = []
+                for branch in (true, false):                    # Each branch is written on its own, then indented
+                    self.lines = []
+                    branches.append((self.emit(branch), self.lines))
+                self.lines = lines
+                ((true_code, true_type), true_lines), ((false_code, false_type), false_lines) = branches
+
+                result, result_type = "None", None              # Without a single type the value isn't kept (and can't be used)
+                if true_type is false_type and true_type is not UNIT_T and true_type is not None:
+                    result, result_type = self.temporary(), true_type
+                    true_lines.append(f"{result} = {true_code}")
+                    false_lines.append(f"{result} = {false_code}")
+                self.lines.append(f"if {condition_code}:")
+                self.lines += [f"    {line}" for line in true_lines or ["pass"]]
+                self.lines.append("else:")
+                self.lines += [f"    {line}" for line in false_lines or ["pass"]]
+                return (result, result_type)
+
+            case BinaryOperator(left=left, right=right):
+                (left_code, left_type), (right_code, right_type) = self.operands(left, right)
+                if left_type is not right_type or not (left_type is INT_T or left_type is FLOAT_T):
+                    raise _Unsupported()
+                result = self.temporary()
+
+                if type(expression) in _COMPARISON_OPS:
+                    self.lines.append(f"{result} = {left_code} {_COMPARISON_OPS[type(expression)]} {right_code}")
+                    return (result, BOOL_T)
+
+                if type(expression) is Divide:
+                    self.guard(f"{right_code} != 0")
+                    operator = "//" if left_type is INT_T else "/"
+                elif type(expression) in _NUMERIC_OPS:
+                    operator = _NUMERIC_OPS[type(expression)]
+                else:
+                    raise _Unsupported()
+
+                if left_type is INT_T:
+                    bound = _MUL_BOUND if type(expression) is Multiply else _INT_BOUND
+                    self.guard(f"-{bound} <= {left_code} <= {bound} and -{bound} <= {right_code} <= {bound}")
+                self.lines.append(f"{result} = {left_code} {operator} {right_code}")
+                return (result, left_type)
+
+            case _:
+                raise _Unsupported()
+
+
+def _kernel_source(condition: Expr, body: Expr, names: List[str], types: Dict[str, Type]) -> str:
+    variables = {name: f"v{i}" for i, name in enumerate(names)}
+    saved = ", ".join(f"s{i}" for i in range(len(names)))
+    current = ", ".join(variables.values())
+
+    writer = _KernelWriter(variables, types)
+    condition_code, condition_type = writer.emit(condition)
+    if condition_type is not BOOL_T:
+        raise _Unsupported()
+    writer.lines.append(f"if not {condition_code}: break")
+    writer.emit(body)
+    if len(writer.lines) > _MAX_KERNEL_LINES:
+        raise _Unsupported()
+
+    loop = "\n".join(f"        {line}" for line in writer.lines)
+    parameters = "".join(f", c{i}" for i in range(writer.literals))
+    return (f"def _kernel({current}{parameters}):\n"
+            f"    while True:\n"
+            f"        {saved} = {current}\n"
+            f"{loop}\n"
+            f"    return True, {current}\n").replace("_bail", f"False, {saved}")
+
+
+_KERNELS: Dict[Any, Dict[Tuple[type, ...], Any]] = {}   # Loop shape -> variable type classes -> compiled kernel (or None if unsupported)
+
+
+class WhileKernel(object):
+    def __init__(self, key: Any, condition: Expr, body: Expr, names: List[str], literals: Tuple[Any, ...]) -> None:
+        self.key = key                      # The loop's shape, shared by every loop that only differs in its literals
+        self.condition = condition
+        self.body = body
+        self.names = names
+        self.literals = literals
+        self.hits = 0
+
+    def specialize(self, types: Tuple[Type, ...]) -> Any:
+        signature = tuple(type(t) for t in types)                       # Types are interned, so their classes identify them
+        compiled = _KERNELS.get(self.key)
+        if compiled is None:
+            if len(_KERNELS) == MAX_KERNELS:
+                del _KERNELS[next(iter(_KERNELS))]                      # Forget the shape that was compiled first
+            compiled = _KERNELS[self.key] = {}
+        if signature not in compiled:
+            try:
+                source = _kernel_source(self.condition, self.body, self.names, dict(zip(self.names, types)))
+            except (_Unsupported, RecursionError):
+                compiled[signature] = None
+            else:
+                from numba import njit                                  # Kernels are only built when numba is available
+                namespace: Dict[str, Any] = {}
+                exec(source, namespace)
+                compiled[signature] = njit(namespace["_kernel"])
+        return compiled[signature]
+
+    def run(self, slots: List[Any], kernel_slots: Tuple[int, ...]) -> bool:
+        """
+        Called by the interpreter at the top of every iteration. Once the loop
+        is hot, runs it against the interpreter's variable slots (the slots
+        of self.names are `kernel_slots`), updating them in place. Returns
+        whether the loop finished; when it did not, the interpreter continues
+        the loop from the updated slots.
+        """
+        self.hits += 1
+        hits = self.hits
+        if hits < WARM_LOOP_THRESHOLD or (hits < HOT_LOOP_THRESHOLD and self.key not in _KERNELS):
+            return False
+
+        values = []
+        types = []
+        for slot in kernel_slots:
+            binding = slots[slot]
+            if binding is None:
+                self.hits = 0
+                return False
+            value, value_type = binding
+            if value_type is INT_T:
+                if abs(value) > _INT_BOUND:
+                    self.hits = 0
+                    return False
+            elif value_type is not FLOAT_T and value_type is not BOOL_T:
+                self.hits = 0
+                return False
+            values.append(value)
+            types.append(value_type)
+
+        if hits < HOT_LOOP_THRESHOLD and tuple(type(t) for t in types) not in _KERNELS[self.key]:
+            return False                                                # Only kernels for other types have been compiled
+        self.hits = 0                                                   # If the kernel bails out, wait for the loop to get hot again
+
+        kernel = self.specialize(tuple(types))
+        if kernel is None:
+            return False
+
+        finished, *values = kernel(*values, *self.literals)
+        for slot, value, value_type in zip(kernel_slots, values, types):
+            slots[slot] = (_UNBOX[value_type](value), value_type)
+        return finished
+
+
+def try_jit_while(condition: Expr, body: Expr) -> Optional[WhileKernel]:
+    if not NUMBA_AVAILABLE:
+        return None
+
+    names: List[str] = []
+    literals: List[Any] = []
+    try:
+        _collect_variables(condition, names, literals)
+        _collect_variables(body, names, literals)
+        key = _structural_key(While(condition, body))
+    except (_Unsupported, RecursionError):                             # Loops nested too deeply to walk are left to the interpreter
+        return None
+    if not names:
+        return None
+    return WhileKernel(key, condition, body, names, tuple(literals))
@@ -1,8 +1,12 @@
-from typing import Any, Tuple, Optional
+import operator
+from typing import Any, Callable, List, Tuple, Optional
 
-from stimpl.expression import *
-from stimpl.types import *
-from stimpl.errors import *
+from stimpl.expression import Expr
+from stimpl.types import Type, BOOL_T, FLOAT_T, INT_T, STR_T, UNIT_T
+from stimpl.errors import InterpMathError, InterpSyntaxError, InterpTypeError
+from stimpl.compiler import (BINARY_OP_COUNT, OP_APPLY_VAR_CONST, OP_JMP, OP_JMP_IF_FALSE, OP_JMP_IF_FALSE_OR_POP,
+                             OP_JMP_IF_TRUE, OP_JMP_IF_TRUE_OR_POP, OP_LOAD, OP_NOT, OP_POP, OP_PRINT, OP_PUSH_CONST,
+                             OP_RUN_BLOCK, OP_STORE, OP_STORE_POP, OP_WHILE_KERNEL, compile_stimpl)
 
 """
 Interpreter State
@@ -10,404 +14,459 @@ Interpreter State
 
 
 class State(object):
-    def __init__(self, variable_name: str, variable_value: Expr, variable_type: Type, next_state: 'State') -> None:
-        self.variable_name = variable_name
-        self.value = (variable_value, variable_type)
-        self.next_state = next_state
+    __slots__ = ('bindings', 'types')
+
+    def __init__(self, variable_name: str, variable_value: Expr, variable_type: Type, parent_bindings: Optional[dict] = None, parent_types: Optional[dict] = None) -> None:
+        self.bindings = parent_bindings.copy() if parent_bindings else {}     # Every binding lives in one dict, so reads are a single hash probe
+        self.bindings[variable_name] = (variable_value, variable_type)
+
+        if parent_types is not None and parent_types.get(variable_name) is variable_type:
+            self.types = parent_types                           # Types only change on declaration, so share the parent's map
+        else:
+            self.types = parent_types.copy() if parent_types else {}
+            self.types[variable_name] = variable_type
+
+    @classmethod
+    def _from_dicts(cls, bindings: dict, types: dict) -> 'State':
+        state = object.__new__(cls)                             # Takes ownership of prebuilt dicts instead of copying them
+        state.bindings = bindings
+        state.types = types
+        return state
 
     def copy(self) -> 'State':
-        variable_value, variable_type = self.value
-        return State(self.variable_name, variable_value, variable_type, self.next_state)
+        return State._from_dicts(self.bindings.copy(), self.types)     # Types maps are never mutated once built, so they can be shared
 
     def set_value(self, variable_name, variable_value, variable_type):
-        return State(variable_name, variable_value, variable_type, self)
+        return State(variable_name, variable_value, variable_type, self.bindings, self.types)  # Copy-on-write: older states keep their own bindings
 
     def get_value(self, variable_name) -> Any:
-        currState = self                                        # Storing current state of the program in 'currState'
-        while not isinstance(currState, EmptyState):            # Making sure we are not calling member variables of an empty state
-            if currState.variable_name == variable_name:        # Search for our variable in the current state
-                return currState.value                          # Found it! Return it's value and type
-            else:
-                currState = currState.next_state                # Check the next state if it is not found in current state
-
-        return None                                             # Return None if it isn't found in any state
+        return self.bindings.get(variable_name)                 # Return the (value, type) pair, or None if it isn't bound
 
     def __repr__(self) -> str:
-        return f"{self.variable_name}: {self.value}, " + repr(self.next_state)
+        return "".join(f"{variable_name}: {value}, " for variable_name, value in reversed(self.bindings.items()))
 
 
 class EmptyState(State):
-    def __init__(self):
-        pass
+    __slots__ = ()
 
-    def copy(self) -> 'EmptyState':
-        return EmptyState()
+    def __new__(cls) -> 'EmptyState':
+        return _EMPTY if _EMPTY is not None else super().__new__(cls)     # There is only one empty state: EmptyState() is EmptyState()
 
-    def get_value(self, variable_name) -> None:
-        return None
+    def __init__(self) -> None:
+        if _EMPTY is not None:                                  # __new__ returned the existing empty state; keep its dicts
+            return
+        self.bindings = {}
+        self.types = {}
+
+    def copy(self) -> 'EmptyState':
+        return self                                             # States are never mutated, so the empty state can be shared
 
     def __repr__(self) -> str:
         return ""
 
 
+_EMPTY: Optional[EmptyState] = None
+_EMPTY = EmptyState()
+
+
+def _state_from(bindings: dict, types: dict) -> State:
+    if not bindings:
+        return EmptyState()
+    return State._from_dicts(bindings, types)
+
+
 """
 Main evaluation logic!
+
+Programs are compiled to flat bytecode (see stimpl/compiler.py) and run on a
+small stack machine. The stack holds (value, type) pairs.
 """
 
+_BOOL_RESULTS: Tuple[Tuple[bool, Type], ...] = ((False, BOOL_T), (True, BOOL_T))   # Indexed by a bool: Boolean results reuse these
 
-def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
-    match expression:
-        case Ren():
-            return (None, Unit(), state)
 
-        case IntLiteral(literal=l):
-            return (l, Integer(), state)
+def _eval_add(stack: List[Tuple[Any, Type]]) -> None:
+    right_result, right_type = stack.pop()
+    left_result, left_type = stack[-1]
+
+    if left_type is not right_type:
+        raise InterpTypeError(f"""Mismatched types for Add:
+    Cannot add {left_type} to {right_type}""")
+
+    if left_type is INT_T or left_type is FLOAT_T or left_type is STR_T:
+        stack[-1] = (left_result + right_result, left_type)
+    else:
+        raise InterpTypeError(f"""Cannot add {left_type}s""")
+
+
+def _eval_subtract(stack: List[Tuple[Any, Type]]) -> None:
+    rightResult, rightType = stack.pop()
+    leftResult, leftType = stack[-1]
+
+    if leftType is not rightType:                                       # If the types are mismatched, throw an error
+        raise InterpTypeError(f"""Mismatched types for Subtract:
+                              Cannot subtract {leftType} from {rightType}""")
+
+    if leftType is INT_T or leftType is FLOAT_T:                        # If the types match, evaluate them
+        stack[-1] = (leftResult - rightResult, leftType)
+    else:                                                               # Raise an error in case type does not support subtraction
+        raise InterpTypeError(f"""Cannot Subtract {leftType}s""")
+
+
+def _eval_multiply(stack: List[Tuple[Any, Type]]) -> None:
+    rightResult, rightType = stack.pop()
+    leftResult, leftType = stack[-1]
+
+    if leftType is not rightType:                                       # Throw an error if the types don't match
+        raise InterpTypeError(f"""Mismatched types for Multiply:
+                              Cannot multiply {leftType}s and {rightType}s""")
+
+    if leftType is INT_T or leftType is FLOAT_T:
+        stack[-1] = (leftResult * rightResult, leftType)
+    else:
+        raise InterpTypeError(f"""Cannot Multiply {leftType}s""")
+
+
+def _eval_divide(stack: List[Tuple[Any, Type]]) -> None:
+    rightResult, rightType = stack.pop()
+    leftResult, leftType = stack[-1]
+
+    if leftType is not rightType:
+        raise InterpTypeError(f"""Mismatched types for Divide:
+                              Cannot multiply {leftType}s and {rightType}s""")
+
+    if rightResult == 0:
+        raise InterpMathError(f"""Cannot Divide by Zero""")
+
+    if leftType is INT_T:
+        stack[-1] = (leftResult // rightResult, leftType)
+    elif leftType is FLOAT_T:
+        stack[-1] = (leftResult / rightResult, leftType)
+    else:
+        raise InterpTypeError(f"Cannot Divide {leftType}s")
+
+
+def _eval_and(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, right_type = stack.pop()
+    left_value, left_type = stack[-1]
+
+    if left_type is not right_type:
+        raise InterpTypeError(f"""Mismatched types for And:
+    Cannot evaluate {left_type} and {right_type}""")
+    if left_type is not BOOL_T:
+        raise InterpTypeError(
+            "Cannot perform logical and on non-boolean operands.")
+    stack[-1] = (left_value and right_value, BOOL_T)
+
 
-        case FloatingPointLiteral(literal=l):
-            return (l, FloatingPoint(), state)
+def _eval_or(stack: List[Tuple[Any, Type]]) -> None:
+    rightResult, rightType = stack.pop()
+    leftResult, leftType = stack[-1]
 
-        case StringLiteral(literal=l):
-            return (l, String(), state)
+    if leftType is not rightType:
+        raise InterpTypeError(f"""Mismatched types for Or:
+    Cannot evaluate {leftType} and {rightType}""")
+    if leftType is not BOOL_T:
+        raise InterpTypeError("Cannot perform logical or on non-boolean operands.")
+    stack[-1] = (leftResult or rightResult, BOOL_T)
 
-        case BooleanLiteral(literal=l):
-            return (l, Boolean(), state)
 
-        case Print(to_print=to_print):
-            printable_value, printable_type, new_state = evaluate(
-                to_print, state)
+def _comparison_handler(operator_name: str, compare: Callable[[Any, Any], bool], unit_result: bool) -> Callable[[List[Tuple[Any, Type]]], None]:
+    """
+    Builds the checked handler for a comparison: `compare` is applied to
+    values of any ordered type, and Unit compares as `unit_result` (there is
+    only one Unit value).
+    """
+    def _eval_comparison(stack: List[Tuple[Any, Type]]) -> None:
+        right_value, right_type = stack.pop()
+        left_value, left_type = stack[-1]
 
-            match printable_type:
-                case Unit():
-                    print("Unit")
-                case _:
-                    print(f"{printable_value}")
+        if left_type is not right_type:
+            raise InterpTypeError(f"""Mismatched types for {operator_name}:
+        Cannot compare {left_type} and {right_type}""")
 
-            return (printable_value, printable_type, new_state)
+        if left_type is UNIT_T:
+            result = unit_result
+        elif left_type is INT_T or left_type is FLOAT_T or left_type is STR_T or left_type is BOOL_T:
+            result = compare(left_value, right_value)
+        else:
+            raise InterpTypeError(f"Cannot compare {left_type}s")
 
-        case Sequence(exprs=exprs) | Program(exprs=exprs):
-            currState = state                                               # Setting up default return, in case of empty sequence/program
-            result = None
-            resultType = Unit()
+        stack[-1] = _BOOL_RESULTS[result]
 
-            for expr in exprs:                                              # Iterating through expressions in the sequence/program
-                result, resultType, currState = evaluate(expr, currState)
+    return _eval_comparison
 
-            return (result, resultType, currState)                          # Return the result, type and state after evaluating all expressions
 
-        case Variable(variable_name=variable_name):
-            value = state.get_value(variable_name)
-            if value == None:
+_eval_lt = _comparison_handler("Lt", operator.lt, False)
+_eval_lte = _comparison_handler("Lte", operator.le, True)
+_eval_gt = _comparison_handler("Gt", operator.gt, False)
+_eval_gte = _comparison_handler("Gte", operator.ge, True)
+_eval_eq = _comparison_handler("Eq", operator.eq, True)
+_eval_ne = _comparison_handler("Ne", operator.ne, False)
+
+
+def _eval_add_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    left_value, left_type = stack[-1]
+    stack[-1] = (left_value + right_value, left_type)
+
+
+def _eval_subtract_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    left_value, left_type = stack[-1]
+    stack[-1] = (left_value - right_value, left_type)
+
+
+def _eval_multiply_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    left_value, left_type = stack[-1]
+    stack[-1] = (left_value * right_value, left_type)
+
+
+def _eval_divide_int(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    if right_value == 0:
+        raise InterpMathError(f"""Cannot Divide by Zero""")
+    stack[-1] = (stack[-1][0] // right_value, INT_T)
+
+
+def _eval_divide_float(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    if right_value == 0:
+        raise InterpMathError(f"""Cannot Divide by Zero""")
+    stack[-1] = (stack[-1][0] / right_value, FLOAT_T)
+
+
+def _eval_and_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = (stack[-1][0] and right_value, BOOL_T)
+
+
+def _eval_or_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = (stack[-1][0] or right_value, BOOL_T)
+
+
+def _eval_lt_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = _BOOL_RESULTS[stack[-1][0] < right_value]
+
+
+def _eval_lte_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = _BOOL_RESULTS[stack[-1][0] <= right_value]
+
+
+def _eval_gt_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = _BOOL_RESULTS[stack[-1][0] > right_value]
+
+
+def _eval_gte_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = _BOOL_RESULTS[stack[-1][0] >= right_value]
+
+
+def _eval_eq_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = _BOOL_RESULTS[stack[-1][0] == right_value]
+
+
+def _eval_ne_typed(stack: List[Tuple[Any, Type]]) -> None:
+    right_value, _ = stack.pop()
+    stack[-1] = _BOOL_RESULTS[not (stack[-1][0] == right_value)]
+
+
+BINARY_HANDLERS = [         # Indexed by opcode. Each handler pops the right operand and overwrites the left with the result
+    _eval_add,
+    _eval_subtract,
+    _eval_multiply,
+    _eval_divide,
+    _eval_and,
+    _eval_or,
+    _eval_lt,
+    _eval_lte,
+    _eval_gt,
+    _eval_gte,
+    _eval_eq,
+    _eval_ne,
+    _eval_add_typed,
+    _eval_subtract_typed,
+    _eval_multiply_typed,
+    _eval_divide_int,
+    _eval_divide_float,
+    _eval_and_typed,
+    _eval_or_typed,
+    _eval_lt_typed,
+    _eval_lte_typed,
+    _eval_gt_typed,
+    _eval_gte_typed,
+    _eval_eq_typed,
+    _eval_ne_typed,
+]
+
+
+def run(code: List[int], consts: List[Any], names: List[str], state: State) -> Tuple[Optional[Any], Type, State]:
+    bindings = state.bindings
+    slots: List[Any] = [bindings.get(variable_name) for variable_name in names]    # (value, type) pair, or None if unassigned
+    declared: List[int] = []                                            # Slots of newly assigned variables, in assignment order
+    stack: List[Tuple[Any, Type]] = []
+    push = stack.append                                                 # Local aliases avoid attribute lookups in the loop
+    pop = stack.pop
+    binary_handlers = BINARY_HANDLERS
+    binary_op_count = BINARY_OP_COUNT                                   # Constants are bound to locals too: a local is cheaper
+    bool_t = BOOL_T                                                     # to read than a global, and much cheaper under mypyc
+    bool_results = _BOOL_RESULTS
+    op_apply_var_const, op_load, op_push_const = OP_APPLY_VAR_CONST, OP_LOAD, OP_PUSH_CONST
+    op_jmp_if_true, op_run_block, op_store_pop = OP_JMP_IF_TRUE, OP_RUN_BLOCK, OP_STORE_POP
+    op_jmp_if_false, op_jmp, op_jmp_if_false_or_pop = OP_JMP_IF_FALSE, OP_JMP, OP_JMP_IF_FALSE_OR_POP
+    op_jmp_if_true_or_pop, op_pop, op_store = OP_JMP_IF_TRUE_OR_POP, OP_POP, OP_STORE
+    op_not, op_while_kernel, op_print = OP_NOT, OP_WHILE_KERNEL, OP_PRINT
+    pc = 0
+    code_length = len(code)
+
+    while pc < code_length:
+        op = code[pc]
+        pc += 1
+
+        if op < binary_op_count:                                        # Binary operators dispatch through the handler table
+            binary_handlers[op](stack)
+
+        elif op == op_apply_var_const:
+            value = slots[code[pc]]
+            if value is None:
                 raise InterpSyntaxError(
-                    f"Cannot read from {variable_name} before assignment.")
-            variable_value, variable_type = value
-            return (variable_value, variable_type, state)
+                    f"Cannot read from {names[code[pc]]} before assignment.")
+            operation, right_value, result_type = consts[code[pc + 1]]
+            push((operation(value[0], right_value), result_type))
+            pc += 2
+
+        elif op == op_load:
+            value = slots[code[pc]]
+            if value is None:
+                raise InterpSyntaxError(
+                    f"Cannot read from {names[code[pc]]} before assignment.")
+            push(value)
+            pc += 1
+
+        elif op == op_push_const:
+            push(consts[code[pc]])
+            pc += 1
+
+        elif op == op_jmp_if_true:
+            condResult, condType = pop()
+            if condType is not bool_t:
+                raise InterpTypeError(consts[code[pc + 1]].format(condType))
+            if condResult:
+                pc = code[pc]
+            else:
+                pc += 2
+
+        elif op == op_run_block:
+            consts[code[pc]](slots, declared)                           # Runs a whole block of assignments
+            pc += 1
 
-        case Assign(variable=variable, value=value):
+        elif op == op_store_pop:
+            slot = code[pc]
+            pc += 1
+            value = pop()                                               # Same as OP_STORE, for assignments whose value is unused
+
+            binding = slots[slot]
+            if binding is None:
+                declared.append(slot)
+            elif binding[1] is not value[1]:
+                raise InterpTypeError(f"""Mismatched types for Assignment:
+            Cannot assign {value[1]} to {binding[1]}""")
 
-            value_result, value_type, new_state = evaluate(value, state)
+            slots[slot] = value
 
-            variable_from_state = new_state.get_value(variable.variable_name)
-            _, variable_type = variable_from_state if variable_from_state else (
-                None, None)
+        elif op == op_jmp_if_false:
+            condResult, condType = pop()
+            if condType is not bool_t:
+                raise InterpTypeError(consts[code[pc + 1]].format(condType))
+            if condResult:
+                pc += 2
+            else:
+                pc = code[pc]
+
+        elif op == op_jmp:
+            pc = code[pc]
+
+        elif op == op_jmp_if_false_or_pop:                              # The condition is known to be a Boolean
+            if stack[-1][0]:
+                pop()
+                pc += 1
+            else:
+                pc = code[pc]
 
-            if value_type != variable_type and variable_type != None:
+        elif op == op_jmp_if_true_or_pop:
+            if stack[-1][0]:
+                pc = code[pc]
+            else:
+                pop()
+                pc += 1
+
+        elif op == op_pop:
+            pop()
+
+        elif op == op_store:
+            slot = code[pc]
+            pc += 1
+            value = stack[-1]                                           # Assignments evaluate to the assigned value
+
+            binding = slots[slot]                                       # A variable's type is that of its first assignment
+            if binding is None:
+                declared.append(slot)
+            elif binding[1] is not value[1]:
                 raise InterpTypeError(f"""Mismatched types for Assignment:
-            Cannot assign {value_type} to {variable_type}""")
-
-            new_state = new_state.set_value(
-                variable.variable_name, value_result, value_type)
-            return (value_result, value_type, new_state)
-
-        case Add(left=left, right=right):
-            result = 0
-            left_result, left_type, new_state = evaluate(left, state)
-            right_result, right_type, new_state = evaluate(right, new_state)
-
-            if left_type != right_type:
-                raise InterpTypeError(f"""Mismatched types for Add:
-            Cannot add {left_type} to {right_type}""")
-
-            match left_type:
-                case Integer() | String() | FloatingPoint():
-                    result = left_result + right_result
-                case _:
-                    raise InterpTypeError(f"""Cannot add {left_type}s""")
-
-            return (result, left_type, new_state)
-
-        case Subtract(left=left, right=right):
-            result = 0
-            leftResult, leftType, newState = evaluate(left, state)          # Evaluating the left side of the minus
-            rightResult, rightType, newState = evaluate(right, newState)    # Evaluating the right side of the minus
-
-            if leftType != rightType:                                       # If the types are mismatched, throw an error
-                raise InterpTypeError(f"""Mismatched types for Subtract:
-                                      Cannot subtract {leftType} from {rightType}""")
-
-            match leftType:                                                 # If the types match, evaluate them
-                case Integer() | FloatingPoint():
-                    result = leftResult - rightResult                       # Subtract the left and right if they are both either integers or floating points
-                case _:                                                     # Raise an error in case type does not support subtraction
-                    raise InterpTypeError(f"""Cannot Subtract {leftType}s""")
-
-            return (result, leftType, newState)                             # Return result of subtraction with it's type and the new state!
-
-        case Multiply(left=left, right=right):
-            result = 0
-            leftResult, leftType, newState = evaluate(left, state)          # Evaluating the left side of the multiplication
-            rightResult, rightType, newState = evaluate(right, newState)    # Evaluating the right side of the multiplication
-
-            if leftType != rightType:                                       # Throw an error if the types don't match
-                raise InterpTypeError(f"""Mismatched types for Multiply:
-                                      Cannot multiply {leftType}s and {rightType}s""")
-
-            match leftType:                                                 # If the types match, proceed to evaluating the result
-                case Integer() | FloatingPoint():
-                    result = leftResult * rightResult                       # Multiply the left and right if they are both either Integers or Floating points
-                case _:                                                     # Otherwise, raise an error
-                    raise InterpTypeError(f"""Cannot Multiply {leftType}s""")
-
-            return (result, leftType, newState)                             # Return result, it's type and new state
-
-        case Divide(left=left, right=right):
-            result = 0
-            leftResult, leftType, newState = evaluate(left, state)          # Evaluate the left side of division
-            rightResult, rightType, newState = evaluate(right, newState)    # Evaluate the right side of division
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Divide:
-                                      Cannot multiply {leftType}s and {rightType}s""")
-
-            if rightResult == 0:
-                raise InterpMathError(f"""Cannot Divide by Zero""")
-
-            match leftType:
-                case Integer():
-                    result = leftResult // rightResult
-                case FloatingPoint():
-                    result = leftResult / rightResult
-                case _:
-                    raise InterpTypeError(f"Cannot Divide {leftType}s")
-
-            return (result, leftType, newState)
-
-        case And(left=left, right=right):
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
-
-            if left_type != right_type:
-                raise InterpTypeError(f"""Mismatched types for And:
-            Cannot evaluate {left_type} and {right_type}""")
-            match left_type:
-                case Boolean():
-                    result = left_value and right_value
-                case _:
-                    raise InterpTypeError(
-                        "Cannot perform logical and on non-boolean operands.")
-
-            return (result, left_type, new_state)
-
-        case Or(left=left, right=right):
-            leftResult, leftType, newState = evaluate(left, state)
-            rightResult, rightType, newState = evaluate(right, newState)
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Or:
-            Cannot evaluate {leftType} and {rightType}""")
-            match leftType:
-                case Boolean():
-                    result = leftResult or rightResult
-                case _:
-                    raise InterpTypeError("Cannot perform logical or on non-boolean operands.")
-
-            return (result, leftType, newState)
-
-        case Not(expr=expr):
-            exprResult, exprType, newState = evaluate(expr, state)
-
-            match exprType:
-                case Boolean():
-                   result = not(exprResult)
-                case _:
-                   raise InterpTypeError("Cannot perform logical not on non-boolean operand.")
-
-            return (result, exprType, newState)
-
-        case If(condition=condition, true=true, false=false):
-            condResult, condType, newState = evaluate(condition, state)
-
-            match condType:
-                case Boolean():
-                    tempRes = (condResult == True)
-                    if tempRes:
-                        result, resultType, newState = evaluate(true, newState)
-                    else:
-                        result, resultType, newState = evaluate(false, newState)
-                case _:
-                    raise InterpTypeError("Cannot perform If conditional on non-boolean condition")
-
-            return (result, resultType, newState)
-
-        case Lt(left=left, right=right):
-            left_value, left_type, new_state = evaluate(left, state)
-            right_value, right_type, new_state = evaluate(right, new_state)
-
-            result = None
-
-            if left_type != right_type:
-                raise InterpTypeError(f"""Mismatched types for Lt:
-            Cannot compare {left_type} and {right_type}""")
-
-            match left_type:
-                case Integer() | Boolean() | String() | FloatingPoint():
-                    result = left_value < right_value
-                case Unit():
-                    result = False
-                case _:
-                    raise InterpTypeError(
-                        f"Cannot perform < on {left_type} type.")
-
-            return (result, Boolean(), new_state)
-
-        case Lte(left=left, right=right):
-            leftVal, leftType, newState = evaluate(left, state)
-            rightVal, rightType, newState = evaluate(right, newState)
-
-            result = None
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Lte:
-                Cannot compare {leftType} and {rightType}""")
-
-            match leftType:
-                case Integer() | Boolean() | String() | FloatingPoint():
-                    result = leftVal <= rightVal
-                case Unit():
-                    match rightType:
-                        case Unit():
-                            result = True
-                        case _:
-                            result = False
-                case _:
-                    raise InterpTypeError(f"Cannot compare {leftType}s")
-
-            return (result, Boolean(), newState)
-
-        case Gt(left=left, right=right):
-            leftVal, leftType, newState = evaluate(left, state)
-            rightVal, rightType, newState = evaluate(right, newState)
-
-            result = None
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Gt:
-                Cannot compare {leftType} and {rightType}""")
-
-            match leftType:
-                case Integer() | Boolean() | String() | FloatingPoint():
-                    result = leftVal > rightVal
-                case Unit():
-                    result = False
-                case _:
-                    raise InterpTypeError(f"Cannot compare {leftType}s")
-
-            return (result, Boolean(), newState)
-
-
-        case Gte(left=left, right=right):
-            leftVal, leftType, newState = evaluate(left, state)
-            rightVal, rightType, newState = evaluate(right, newState)
-
-            result = None
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Gte:
-                Cannot compare {leftType} and {rightType}""")
-
-            match leftType:
-                case Integer() | Boolean() | String() | FloatingPoint():
-                    result = leftVal >= rightVal
-                case Unit():
-                    match rightType:
-                        case Unit():
-                            result = True
-                        case _:
-                            result = False
-                case _:
-                    raise InterpTypeError(f"Cannot compare {leftType}s")
-
-            return (result, Boolean(), newState)
-
-        case Eq(left=left, right=right):
-            leftVal, leftType, newState = evaluate(left, state)
-            rightVal, rightType, newState = evaluate(right, newState)
-
-            result = None
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Eq:
-                Cannot compare {leftType} and {rightType}""")
-
-            match leftType:
-                case Integer() | Boolean() | String() | FloatingPoint():
-                    result = (leftVal == rightVal)
-                case Unit():
-                    match rightType:
-                        case Unit():
-                            result = True
-                        case _:
-                            result = False
-                case _:
-                    raise InterpTypeError(f"Cannot compare {leftType}s")
-
-            return (result, Boolean(), newState)
-
-        case Ne(left=left, right=right):
-            leftVal, leftType, newState = evaluate(left, state)
-            rightVal, rightType, newState = evaluate(right, newState)
-
-            result = None
-
-            if leftType != rightType:
-                raise InterpTypeError(f"""Mismatched types for Ne:
-                Cannot compare {leftType} and {rightType}""")
-
-            match leftType:
-                case Integer() | Boolean() | String() | FloatingPoint():
-                    result = not (leftVal == rightVal)
-                case Unit():
-                    match rightType:
-                        case Unit():
-                            result = False
-                        case _:
-                            result = True
-                case _:
-                    raise InterpTypeError(f"Cannot compare {leftType}s")
-
-            return (result, Boolean(), newState)
-
-        case While(condition=condition, body=body):
-            currState = state
-
-            while True:
-                condResult, condType, state = evaluate(condition, state)
-
-                match condType:
-                    case Boolean():
-                        if condResult:
-                            condResult, condType, state = evaluate(body, state)
-                        else:
-                            return (condResult, condType, state)
-                    case _:
-                        raise InterpTypeError(f"Cannot evaluate while loops for {condType}s")
-
-        case _:
+            Cannot assign {value[1]} to {binding[1]}""")
+
+            slots[slot] = value
+
+        elif op == op_not:
+            exprResult, exprType = pop()
+
+            if exprType is not bool_t:
+                raise InterpTypeError("Cannot perform logical not on non-boolean operand.")
+            push(bool_results[not exprResult])
+
+        elif op == op_while_kernel:
+            kernel, kernel_slots = consts[code[pc]]
+            if kernel.run(slots, kernel_slots):
+                pc = code[pc + 1]                                       # The exit pushes the loop's value
+            else:
+                pc += 2
+
+        elif op == op_print:
+            printable_value, printable_type = stack[-1]                 # Print evaluates to the printed value
+
+            if printable_type is UNIT_T:
+                print("Unit")
+            else:
+                print(f"{printable_value}")
+
+        else:
             raise InterpSyntaxError("Unhandled!")
-    pass
+
+    result, resultType = stack.pop()
+    bindings = bindings.copy()
+    types = state.types.copy()
+    for slot in declared:                                               # New variables are added in the order they were assigned
+        bindings[names[slot]] = slots[slot]
+        types[names[slot]] = slots[slot][1]
+    for variable_name, binding in zip(names, slots):
+        if binding is not None:
+            bindings[variable_name] = binding
+    return (result, resultType, _state_from(bindings, types))
+
+
+def evaluate(expression: Expr, state: State) -> Tuple[Optional[Any], Type, State]:
+    code, consts, names = compile_stimpl(expression, state.types)
+    return run(code, consts, names, state)
 
 
 def run_stimpl(program, debug=False):
-    state = EmptyState()
+    state = _EMPTY
     program_value, program_type, program_state = evaluate(program, state)
 
     if debug:
@@ -0,0 +1,132 @@
+from stimpl import jit
+from stimpl.compiler import *
+from stimpl.inference import infer_variable_types
+from stimpl.expression import *
+from stimpl.errors import *
+from stimpl.types import *
+from stimpl.runtime import EmptyState, evaluate, run_stimpl
+from stimpl.test import check_equal, check_program_raises
+
+def test_compiler_implementation():
+    program = Program(Assign(Variable("x"), IntLiteral(1)), Add(Variable("x"), Variable("x")))
+    check_equal(OP_ADD_TYPED, compile_stimpl(program)[0][-1])
+    check_equal((2, Integer()), run_stimpl(program)[:2])
+    check_program_raises(InterpSyntaxError(), Add(Variable("x"), IntLiteral(1)))
+    check_program_raises(InterpTypeError(), Divide(IntLiteral(1), StringLiteral("1")))
+    program = Multiply(Add(IntLiteral(1), IntLiteral(2)), IntLiteral(4))
+    check_equal([(12, Integer())], compile_stimpl(program)[1])
+    check_equal((12, Integer()), run_stimpl(program)[:2])
+    check_equal((False, Boolean()), run_stimpl(Not(Lt(StringLiteral("a"), StringLiteral("b"))))[:2])
+    check_program_raises(InterpMathError(), Divide(IntLiteral(1), IntLiteral(0)))
+    program = Program(Assign(Variable("x"), IntLiteral(1)), Add(Variable("x"), IntLiteral(2)))
+    check_equal(True, OP_APPLY_VAR_CONST in compile_stimpl(program)[0])
+    check_equal((3, Integer()), run_stimpl(program)[:2])
+    maybe_x = If(Variable("b"), Assign(Variable("x"), IntLiteral(1)), Ren())     # x has a static type but may not be assigned
+    check_program_raises(InterpSyntaxError(), Program(Assign(Variable("b"), BooleanLiteral(False)), maybe_x, Lt(Variable("x"), IntLiteral(2))))
+    check_program_raises(InterpMathError(), Program(Assign(Variable("x"), IntLiteral(1)), Divide(Variable("x"), IntLiteral(0))))
+    program = If(Lt(IntLiteral(2), IntLiteral(1)), IntLiteral(1), Variable("x"))
+    check_equal([], compile_stimpl(program)[1])
+    check_program_raises(InterpSyntaxError(), program)
+    check_equal((1, Integer()), run_stimpl(If(Lt(IntLiteral(1), IntLiteral(2)), IntLiteral(1), Divide(IntLiteral(1), IntLiteral(0))))[:2])
+    check_equal((None, Unit()), run_stimpl(Program())[:2])
+    program = Sequence(Assign(Variable("i"), Variable("k")), Variable("i"))
+    check_program_raises(InterpSyntaxError(), program)
+    value, value_type, state = evaluate(program, EmptyState().set_value("k", 5, Integer()))
+    check_equal((5, Integer(), (5, Integer())), (value, value_type, state.get_value("i")))
+    program = Sequence(
+        Assign(Variable("i"), IntLiteral(3)),
+        Assign(Variable("j"), Divide(Variable("i"), IntLiteral(2))),
+        Variable("i"))
+    check_equal(False, OP_RUN_BLOCK in compile_stimpl(program)[0])
+    value, value_type, state = run_stimpl(program)
+    check_equal((3, Integer(), "j: (1, Integer), i: (3, Integer), "), (value, value_type, repr(state)))
+    program = Program(
+        Assign(Variable("s"), StringLiteral("")),
+        Assign(Variable("i"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(3)),
+              Sequence(Assign(Variable("s"), Add(Variable("s"), StringLiteral("a"))),
+                       Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))),
+        While(Lt(Variable("i"), IntLiteral(0)), Assign(Variable("x"), Variable("s"))),
+        Variable("s"))
+    check_equal(OP_RUN_BLOCK, compile_stimpl(program)[0][0])
+    value, value_type, state = run_stimpl(program)
+    check_equal(("aaa", String(), (3, Integer()), None), (value, value_type, state.get_value("i"), state.get_value("x")))
+    check_program_raises(InterpMathError(), Sequence(Assign(Variable("i"), IntLiteral(0)), Assign(Variable("j"), Divide(IntLiteral(1), Variable("i")))))
+    check_program_raises(InterpSyntaxError(), Program(Assign(Variable("b"), BooleanLiteral(False)), maybe_x, Assign(Variable("j"), Add(Variable("x"), IntLiteral(1)))))
+    check_program_raises(InterpSyntaxError(), Sequence(Assign(Variable("i"), IntLiteral(0)), Lt(Variable("i"), IntLiteral(1)), Variable("j"), Ren()))
+    check_equal((None, Unit()), run_stimpl(Sequence(Assign(Variable("i"), IntLiteral(0)), If(Lt(Variable("i"), IntLiteral(1)), Ren(), Ren()), Ren()))[:2])
+    check_program_raises(InterpSyntaxError(), While(Variable("b"), Print(Variable("b"))))
+    check_program_raises(InterpTypeError(), While(IntLiteral(1), Ren()))
+    program = Program(
+        Assign(Variable("b"), BooleanLiteral(False)),
+        Assign(Variable("i"), IntLiteral(1)),
+        And(Variable("b"), Lt(Variable("i"), IntLiteral(2))))
+    check_equal(True, OP_JMP_IF_FALSE_OR_POP in compile_stimpl(program)[0])
+    check_equal((False, Boolean()), run_stimpl(program)[:2])
+    state = EmptyState().set_value("b", True, Boolean()).set_value("c", False, Boolean())
+    check_equal((True, Boolean()), evaluate(Or(Variable("b"), Variable("c")), state)[:2])
+    check_program_raises(InterpSyntaxError(), Program(           # The right operand is evaluated even though b decides the And
+        Assign(Variable("b"), BooleanLiteral(False)),
+        If(Variable("b"), Assign(Variable("c"), BooleanLiteral(True)), Ren()),
+        And(Variable("b"), Variable("c"))))
+    check_program_raises(InterpMathError(), Program(
+        Assign(Variable("b"), BooleanLiteral(False)),
+        And(Variable("b"), Eq(Divide(IntLiteral(1), IntLiteral(0)), IntLiteral(1)))))
+    variable_types = infer_variable_types(Program(
+        Assign(Variable("i"), IntLiteral(0)),
+        While(Lt(Variable("i"), IntLiteral(10)),
+              Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))),
+        If(Variable("b"), Assign(Variable("j"), Ren()), Assign(Variable("j"), IntLiteral(1)))))
+    check_equal(Integer(), variable_types["i"])
+    check_equal(None, variable_types["j"])
+    check_equal(False, "b" in variable_types)
+    deep = Variable("x")
+    for _ in range(5000):                                   # Deeper than Python's recursion limit
+        deep = Add(deep, Variable("x"))
+    check_equal((5001, Integer()), run_stimpl(Program(Assign(Variable("x"), IntLiteral(1)), deep))[:2])
+    value, value_type, state = run_stimpl(Program(           # The right operand of Add reassigns its left operand
+        Assign(Variable("f"), FloatingPointLiteral(1.0)),
+        Assign(Variable("f"), Add(Variable("f"), Sequence(Assign(Variable("f"), FloatingPointLiteral(0.0)), Variable("f")))),
+        Ren()))
+    check_equal((1.0, FloatingPoint()), state.get_value("f"))
+    chain = Variable("c")
+    for k in range(2000):                                   # Right-nested Ands and Ors whose right operands can be skipped
+        chain = (And if k % 2 else Or)(Variable("b"), chain)
+    check_equal((False, Boolean()), run_stimpl(Program(Assign(Variable("b"), BooleanLiteral(False)), Assign(Variable("c"), BooleanLiteral(True)), chain))[:2])
+    nested = Print(Variable("i"))
+    for _ in range(300):                                    # Too deep for a block, at every level
+        nested = While(Lt(Variable("i"), IntLiteral(1)), Sequence(Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))), nested))
+    check_equal((1, Integer()), run_stimpl(Program(Assign(Variable("i"), IntLiteral(0)), nested))[2].get_value("i"))
+    variable_types = infer_variable_types(Program(Assign(Variable("i"), IntLiteral(0)), Variable("s")), {"s": String(), "i": String()})
+    check_equal(String(), variable_types["s"])
+    check_equal(None, variable_types["i"])
+    hot_loop_threshold = jit.HOT_LOOP_THRESHOLD
+    jit.HOT_LOOP_THRESHOLD = 10                             # So that loops reach their kernels (when numba is installed)
+    try:
+        untyped = If(Lt(Variable("i"), IntLiteral(0)), Assign(Variable("i"), StringLiteral("")), Ren())   # i has no static type
+        loop = While(Lt(Variable("i"), IntLiteral(2000)), Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))
+        value, value_type, state = run_stimpl(Program(Assign(Variable("i"), IntLiteral(0)), untyped, Ne(BooleanLiteral(True), loop)))
+        check_equal((True, Boolean(), (2000, Integer())), (value, value_type, state.get_value("i")))
+        check_program_raises(InterpTypeError(), Program(Assign(Variable("i"), IntLiteral(0)), untyped, Add(IntLiteral(1), loop)))
+        jit._KERNELS.clear()
+        for bound in (2000, 3000):                          # Loops that only differ in a literal share their kernel
+            loop = While(Lt(Variable("i"), IntLiteral(bound)), Assign(Variable("i"), Add(Variable("i"), IntLiteral(1))))
+            value, value_type, state = run_stimpl(Program(Assign(Variable("i"), IntLiteral(0)), untyped, loop))
+            check_equal((bound, Integer()), state.get_value("i"))
+        check_equal([1] if jit.NUMBA_AVAILABLE else [], [len(compiled) for compiled in jit._KERNELS.values()])
+        step = Assign(Variable("f"), Add(Variable("f"), Sequence(Assign(Variable("f"), FloatingPointLiteral(0.0)), Variable("f"))))
+        loop = While(Lt(Variable("i"), IntLiteral(2000)), Sequence(step, Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))))
+        value, value_type, state = run_stimpl(Program(Assign(Variable("i"), IntLiteral(0)), Assign(Variable("f"), FloatingPointLiteral(1.0)), untyped, loop))
+        check_equal((1.0, FloatingPoint()), state.get_value("f"))
+        x, y, n = Variable("x"), Variable("y"), Variable("n")
+        for start in (2 ** 62, -2 ** 62, 2 ** 62 - 1):       # Sums and differences of ±2**62 overflow an int64
+            negative = Or(Lt(Add(x, x), IntLiteral(0)), Lt(Subtract(x, IntLiteral(-2 ** 62)), IntLiteral(0)))
+            loop = While(Lt(Variable("i"), IntLiteral(2000)), Sequence(
+                Assign(x, Add(y, IntLiteral(1 if start == 2 ** 62 - 1 else 0))),
+                If(negative, Assign(n, Add(n, IntLiteral(1))), Ren()),
+                Assign(Variable("i"), Add(Variable("i"), IntLiteral(1)))))
+            value, value_type, state = run_stimpl(Program(Assign(Variable("i"), IntLiteral(0)), Assign(y, IntLiteral(start)),
+                                                          Assign(x, IntLiteral(0)), Assign(n, IntLiteral(0)), untyped, loop))
+            check_equal((2000 if start < 0 else 0, Integer()), state.get_value("n"))
+    finally:
+        jit.HOT_LOOP_THRESHOLD = hot_loop_threshold
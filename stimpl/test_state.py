@@ -5,6 +5,9 @@ from stimpl.test import check_equal
 def test_state_implementation():
     state = EmptyState()
     check_equal(None, state.get_value("x")) 
+    check_equal(True, EmptyState() is state)
+    bindings = state.bindings
+    check_equal(True, EmptyState().bindings is bindings)
     state2 = state.set_value("x", 5, Integer())
     check_equal((5, Integer()), state2.get_value("x"))
     state3 = state2.set_value("k", True, Boolean())
@@ -12,4 +15,10 @@ def test_state_implementation():
     state4 = state3.set_value("x", 7, Integer())
     check_equal((7, Integer()),state4.get_value("x"))
     check_equal((5, Integer()), state2.get_value("x"))
-    check_equal(None,state4.get_value("y"))
\ No newline at end of file
+    check_equal(None,state4.get_value("y"))
+    check_equal(Integer(), state4.types["x"])
+    check_equal(None, state2.types.get("k"))
+    state5 = state4.copy()
+    check_equal(False, state5 is state4)
+    check_equal(list(state4.bindings.items()), list(state5.bindings.items()))
+    check_equal(Boolean(), state5.types["k"])
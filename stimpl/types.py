@@ -4,9 +4,22 @@ Types
 
 
 class Type(object):
+    def __new__(cls):
+        instance = cls.__dict__.get("_instance")                # Each type is interned: Integer() is Integer()
+        if instance is None:
+            instance = super().__new__(cls)
+            cls._instance = instance
+        return instance
+
     def __init__(self):
         pass
 
+    def __eq__(self, other):
+        return self is other or type(self) is type(other)       # Interned, so identity almost always decides
+
+    def __hash__(self):
+        return hash(type(self))
+
 
 class Unit(Type):
     def __init__(self):
@@ -15,13 +28,6 @@ class Unit(Type):
     def __repr__(self):
         return "Unit"
 
-    def __eq__(self, other):
-        match other:
-            case Unit():
-                return True
-            case _:
-                return False
-
 
 class Integer(Type):
     def __init__(self):
@@ -30,13 +36,6 @@ class Integer(Type):
     def __repr__(self):
         return "Integer"
 
-    def __eq__(self, other):
-        match other:
-            case Integer():
-                return True
-            case _:
-                return False
-
 
 class FloatingPoint(Type):
     def __init__(self):
@@ -45,13 +44,6 @@ class FloatingPoint(Type):
     def __repr__(self):
         return "FloatingPoint"
 
-    def __eq__(self, other):
-        match other:
-            case FloatingPoint():
-                return True
-            case _:
-                return False
-
 
 class String(Type):
     def __init__(self):
@@ -60,13 +52,6 @@ class String(Type):
     def __repr__(self):
         return "String"
 
-    def __eq__(self, other):
-        match other:
-            case String():
-                return True
-            case _:
-                return False
-
 
 class Boolean(Type):
     def __init__(self):
@@ -75,9 +60,13 @@ class Boolean(Type):
     def __repr__(self):
         return "Boolean"
 
-    def __eq__(self, other):
-        match other:
-            case Boolean():
-                return True
-            case _:
-                return False
+
+"""
+Interned type instances. Compare against these with `is`.
+"""
+
+UNIT_T = Unit()
+INT_T = Integer()
+FLOAT_T = FloatingPoint()
+STR_T = String()
+BOOL_T = Boolean()
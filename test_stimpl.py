@@ -2,8 +2,10 @@ from stimpl.expression import BooleanLiteral
 from stimpl.robustness import run_stimpl_robustness_tests
 from stimpl.test import run_stimpl_sanity_tests
 from stimpl.test_state import test_state_implementation
+from stimpl.test_compiler import test_compiler_implementation
 
 if __name__=='__main__':
   test_state_implementation()
+  test_compiler_implementation()
   run_stimpl_sanity_tests()
   run_stimpl_robustness_tests()
\ No newline at end of file